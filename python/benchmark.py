@@ -0,0 +1,218 @@
+from stopwatch import Stopwatch
+from todos import RepoCommitReader, TodoArgs
+from rds import RepoDataSample
+from sloc import SlocHistory
+from git import Repo
+import todo_tab
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse, io, json, os, random, resource, shutil, subprocess, tempfile
+
+class SyntheticRepo:
+    # Writes a local git repository of a given size through git fast-import, which makes
+    # thousands of commits in the time `git commit` takes for a few. Every commit rewrites some
+    # lines of a few files, each new line being a TODO comment with probability todo_density.
+    # The same arguments always give the same history.
+
+    def __init__(self, commits = 500, files = 50, todo_density = 0.02, authors = 10,
+                 lines_per_file = 40, changes_per_commit = 3, seed = 0):
+        self.commits = commits
+        self.files = files
+        self.todo_density = todo_density
+        self.authors = authors
+        self.lines_per_file = lines_per_file
+        self.changes_per_commit = changes_per_commit
+        self.seed = seed
+
+    def new_line(self, rand, commit_index):
+        if rand.random() < self.todo_density:
+            return "    # TODO handle case " + str(rand.randrange(1 << 30))
+        return "    x_" + str(commit_index) + " = " + str(rand.randrange(1 << 30))
+
+    def iter_commands(self):
+        rand = random.Random(self.seed)
+        contents = {} # Map from file name to its lines
+        epoch = 1480000000
+        for commit_index in range(self.commits):
+            author = "dev" + str(rand.randrange(self.authors)) + "@example.com"
+            epoch += rand.randrange(600, 86400)
+            message = "commit " + str(commit_index)
+            yield ("commit refs/heads/master\n"
+                   + "author " + author + " <" + author + "> " + str(epoch) + " +0000\n"
+                   + "committer " + author + " <" + author + "> " + str(epoch) + " +0000\n"
+                   + "data " + str(len(message)) + "\n" + message + "\n")
+            for _ in range(self.changes_per_commit):
+                name = "src/module_" + str(rand.randrange(self.files)) + ".py"
+                lines = contents.get(name)
+                if lines == None:
+                    lines = [self.new_line(rand, commit_index) for _ in range(self.lines_per_file)]
+                else:
+                    for _ in range(rand.randint(1, 4)):
+                        lines[rand.randrange(len(lines))] = self.new_line(rand, commit_index)
+                contents[name] = lines
+                data = ("def f():\n" + "\n".join(lines) + "\n").encode("utf-8")
+                yield "M 100644 inline " + name + "\ndata " + str(len(data)) + "\n"
+                yield data
+                yield "\n"
+
+    def write(self, path):
+        os.makedirs(path)
+        subprocess.run(["git", "init", "-q", path], check = True)
+        subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/master"], cwd = path, check = True)
+        proc = subprocess.Popen(["git", "fast-import", "--quiet"], cwd = path, stdin = subprocess.PIPE)
+        for command in self.iter_commands():
+            proc.stdin.write(command if isinstance(command, bytes) else command.encode("utf-8"))
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError("git fast-import failed on " + path)
+        subprocess.run(["git", "reset", "-q", "--hard"], cwd = path, check = True)
+        return path
+
+class Benchmark:
+    # Times the mining and analysis paths against a synthetic repository: the commit walk, the
+    # todo_tab.py outputs and RepoDataSample loading. Each stage runs in a fresh process, so
+    # that its peak memory is its own.
+
+    HANDLE = "bench/synthetic"
+
+    def __init__(self, work_dir, lines_after = 1, sample_repos = 10, isolated = True):
+        self.work_dir = work_dir
+        self.lines_after = lines_after
+        self.sample_repos = sample_repos # Copies of the outputs RepoDataSample loads together
+        self.isolated = isolated
+
+    def peak_rss_mib():
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    def checkpoint_file(work_dir, source, jobs):
+        return os.path.join(work_dir, "walk_" + source + "_" + str(jobs) + ".pkl")
+
+    def walk_stage(work_dir, repo_dir, lines_after, source, jobs):
+        repo = RepoCommitReader.get_local_repo(repo_dir)
+        with repo.sw.timer("stage"):
+            repo.iterate_over_commits(lines_after = lines_after, jobs = jobs, source = source)
+        repo.save_checkpoint(Benchmark.checkpoint_file(work_dir, source, jobs))
+        return repo.sw, repo.sw.counters["commits"], Benchmark.peak_rss_mib()
+
+    def write_stage(work_dir, repo_dir, output_format):
+        repo = RepoCommitReader.get_local_repo(repo_dir)
+        repo.load_checkpoint(Benchmark.checkpoint_file(work_dir, "gitpython", 1))
+        ta = TodoArgs([Benchmark.HANDLE, "--baseDir", work_dir, "--outputFormat", output_format])
+        sw = Stopwatch()
+        with sw.timer("stage"):
+            todo_tab.write_repo_data(ta, Benchmark.HANDLE, repo, sw)
+        return sw, len(repo.get_todos_map()), Benchmark.peak_rss_mib()
+
+    def load_stage(work_dir, sample_list, jobs):
+        sw = Stopwatch()
+        with sw.timer("stage"):
+            rds = RepoDataSample(sample_list, work_dir, jobs)
+        return sw, len(rds.combined_data), Benchmark.peak_rss_mib()
+
+    def write_sample(self, repo_dir):
+        # The todos written for the synthetic repo, under sample_repos handles, with its line counts each
+        with io.StringIO() as f:
+            SlocHistory(Repo(repo_dir)).write_cloc(f)
+            cloc_text = f.getvalue()
+        todos_file = os.path.join(self.work_dir, "run_bench_synthetic__todos.csv")
+        sample_list = os.path.join(self.work_dir, "samples.csv")
+        data_dir = os.path.join(self.work_dir, "sample")
+        os.makedirs(data_dir, exist_ok = True)
+        with open(sample_list, "w") as f:
+            f.write("repo;Sample\n")
+            for i in range(self.sample_repos):
+                handle = "bench/copy" + str(i)
+                f.write(handle + ";Bench\n")
+                with open(todos_file) as source, open(os.path.join(data_dir, "run_bench_copy" + str(i) + "_todos.csv"), "w") as copy:
+                    copy.write(source.readline())
+                    for line in source:
+                        copy.write(handle + line[line.index(","):])
+                with open(os.path.join(data_dir, "run_bench_copy" + str(i) + "_cloc.csv"), "w") as cloc:
+                    cloc.write(cloc_text)
+        return data_dir, sample_list
+
+    def run_stage(self, stage, *args):
+        if not self.isolated:
+            return stage(*args)
+        # A spawned process starts from nothing, unlike a forked one sharing this one's pages
+        with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn")) as pool:
+            return pool.submit(stage, *args).result()
+
+    def run(self, repo_dir, sources = ("gitpython",), walk_jobs = (1,), output_formats = ("csv",)):
+        # Returns one result per stage run: its name, seconds, items handled, items per second
+        # and the peak memory of its process
+        results = []
+        def record(name, unit, outcome):
+            sw, items, peak = outcome
+            seconds = sw.times["stage"]
+            results.append({"stage": name, "seconds": seconds, "items": items, "unit": unit,
+                            "per_second": (items / seconds if seconds > 0 else None),
+                            "peak_rss_mib": peak, "counters": sw.counters})
+        for source in sources:
+            for jobs in walk_jobs:
+                record("walk " + source + " x" + str(jobs), "commits",
+                       self.run_stage(Benchmark.walk_stage, self.work_dir, repo_dir, self.lines_after, source, jobs))
+        if "gitpython" not in sources or 1 not in walk_jobs:
+            self.run_stage(Benchmark.walk_stage, self.work_dir, repo_dir, self.lines_after, "gitpython", 1)
+        for output_format in output_formats:
+            record("write " + output_format, "todos",
+                   self.run_stage(Benchmark.write_stage, self.work_dir, repo_dir, output_format))
+        if "csv" not in output_formats:
+            self.run_stage(Benchmark.write_stage, self.work_dir, repo_dir, "csv")
+        data_dir, sample_list = self.write_sample(repo_dir)
+        record("load sample", "rows", self.run_stage(Benchmark.load_stage, data_dir, sample_list, None))
+        return results
+
+def format_results(results):
+    lines = ["stage,seconds,items,unit,per second,peak rss MiB"]
+    for result in results:
+        lines.append(",".join(str(value) for value in [result["stage"], round(result["seconds"], 4), result["items"],
+                                                         result["unit"], round(result["per_second"] or 0, 1),
+                                                         round(result["peak_rss_mib"], 1)]))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark mining and analysis against a synthetic repository.')
+    parser.add_argument('--commits', dest='commits', default=500, help='commits to generate (default: 500)')
+    parser.add_argument('--files', dest='files', default=50, help='files to spread changes over (default: 50)')
+    parser.add_argument('--todoDensity', dest='todo_density', default=0.02,
+                        help='chance of each new line being a TODO (default: 0.02)')
+    parser.add_argument('--authors', dest='authors', default=10, help='distinct authors (default: 10)')
+    parser.add_argument('--linesPerFile', dest='lines_per_file', default=40, help='lines per file (default: 40)')
+    parser.add_argument('--changesPerCommit', dest='changes_per_commit', default=3,
+                        help='files changed by each commit (default: 3)')
+    parser.add_argument('--seed', dest='seed', default=0, help='random seed of the history (default: 0)')
+    parser.add_argument('--linesAfter', dest='lines_after', default=1,
+                        help='number of lines to include following the TODO (default: 1)')
+    parser.add_argument('--commitSource', dest='commit_sources', default="gitpython,gitlog",
+                        help='comma separated commit sources to walk with (default: gitpython,gitlog)')
+    parser.add_argument('--walkJobs', dest='walk_jobs', default="1",
+                        help='comma separated walk worker counts to try (default: 1)')
+    parser.add_argument('--outputFormat', dest='output_formats', default="csv",
+                        help='comma separated output formats to write (default: csv)')
+    parser.add_argument('--sampleRepos', dest='sample_repos', default=10,
+                        help='copies of the todos RepoDataSample loads together (default: 10)')
+    parser.add_argument('--workDir', dest='work_dir', default=None,
+                        help='keep the repository and outputs here instead of a temporary directory')
+    parser.add_argument('--output', dest='output', default=None, help='also write the results here, as JSON')
+    args = parser.parse_args()
+
+    work_dir = (tempfile.mkdtemp() if args.work_dir == None else args.work_dir)
+    try:
+        sw = Stopwatch()
+        repo_dir = SyntheticRepo(int(args.commits), int(args.files), float(args.todo_density), int(args.authors),
+                                 int(args.lines_per_file), int(args.changes_per_commit),
+                                 int(args.seed)).write(os.path.join(work_dir, "repo"))
+        sw.lap("generate repo", verbose = 1)
+        benchmark = Benchmark(work_dir, int(args.lines_after), int(args.sample_repos))
+        results = benchmark.run(repo_dir, args.commit_sources.split(","),
+                                [int(jobs) for jobs in args.walk_jobs.split(",")], args.output_formats.split(","))
+        print(format_results(results))
+        if args.output != None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent = 1)
+    finally:
+        if args.work_dir == None:
+            shutil.rmtree(work_dir)
@@ -0,0 +1,36 @@
+import unittest
+from benchmark import SyntheticRepo, Benchmark
+from git import Repo
+import os, tempfile
+
+class BenchmarkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_synthetic_repo(self):
+        synthetic = SyntheticRepo(commits = 30, files = 5, todo_density = 0.2, authors = 3, seed = 7)
+        first = Repo(synthetic.write(os.path.join(self.tmp.name, "first")))
+        second = Repo(synthetic.write(os.path.join(self.tmp.name, "second")))
+        commits = list(first.iter_commits())
+        self.assertEqual(len(commits), 30)
+        self.assertEqual(first.head.commit.hexsha, second.head.commit.hexsha)
+        self.assertLessEqual(len({commit.author.email for commit in commits}), 3)
+        self.assertIn("# TODO", first.git.grep("-h", "TODO", "HEAD"))
+
+    def test_run(self):
+        repo_dir = SyntheticRepo(commits = 20, files = 4, todo_density = 0.2).write(os.path.join(self.tmp.name, "repo"))
+        results = Benchmark(self.tmp.name, sample_repos = 3, isolated = False).run(repo_dir, ["gitpython", "gitlog"])
+        by_stage = {result["stage"]: result for result in results}
+        self.assertEqual(sorted(by_stage), ["load sample", "walk gitlog x1", "walk gitpython x1", "write csv"])
+        self.assertEqual(by_stage["walk gitpython x1"]["items"], 20)
+        self.assertEqual(by_stage["walk gitlog x1"]["counters"]["todo lines matched"],
+                         by_stage["walk gitpython x1"]["counters"]["todo lines matched"])
+        self.assertEqual(by_stage["load sample"]["items"], 3 * by_stage["write csv"]["items"])
+        self.assertGreater(by_stage["write csv"]["peak_rss_mib"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
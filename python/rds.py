@@ -1,7 +1,8 @@
-from os import listdir, remove
-from os.path import isfile, join
+from os import listdir, remove, replace
+from os.path import isfile, join, basename, getmtime, getsize
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from todos import CommitInfo
 
 class RepoDataHeader:
@@ -19,17 +20,32 @@ class RepoDataHeader:
     DAYS_OF_DATA = "Days of Data"
     AUTHOR_UNION = "Author Union"
     AUTHOR_INTERSECT = "Author Intersect"
+    TODO_ID = "todo ID"
+    CONTEXTS = "safe contexts"
+    DATE = "Date"
+    OPEN = "Open TODOs"
+    OPEN_PER_KLOC = "Open TODOs per KLOC"
+    
+    # Column types of a _todos.csv, so that files aren't type sniffed and repo is stored once.
+    # Counts are nullable, so a damaged row shows up as a violation rather than a failed read.
+    TODO_DTYPES = {REPO: "category", TODO_ID: "Int64", ADDED: "string", DELETED: "string",
+                   AGE: "float64", FILETOUCHES: "Int64", AUTHOR_UNION: "Int64", AUTHOR_INTERSECT: "Int64",
+                   TODO: "string", CONTEXTS: "string", FILEPATHS: "string"}
         
 class RepoDatumFileIO:
     # Does everything relating to parsing and validating.
     
+    # In order of preference, so a handle's parquet todos win over its csv ones
+    DATA_SUFFIXES = ["_todos.csv", "_todos.parquet", "_cloc.csv"]
+    
     def __violation(self, violation):
         self.violations.append(violation)
     
-    def __init__(self, handle):
+    def __init__(self, handle, columns = None):
         self.violations = []
         self.handle = handle
-        self.__safe_handle = handle.replace("/", "_").replace("\\", "_").strip()
+        self.columns = columns # Only read these todos columns, or all of them
+        self.__safe_handle = RepoDatumFileIO.safe_handle(handle)
         self.__todo_file = None
         self.__cloc_file = None
 
@@ -43,22 +59,33 @@ class RepoDatumFileIO:
         return True
         
     def __read_todos(self):
-        self.todos = pd.read_csv(self.__todo_file, quotechar='"', skipinitialspace=True)
+        if self.__todo_file.endswith(".parquet"):
+            self.todos = pd.read_parquet(self.__todo_file, columns = self.columns, memory_map = True)
+            self.todos = self.todos.astype({column: dtype for column, dtype in RepoDataHeader.TODO_DTYPES.items()
+                                            if column in self.todos})
+        else:
+            self.todos = pd.read_csv(self.__todo_file, quotechar='"', skipinitialspace=True,
+                                     dtype = RepoDataHeader.TODO_DTYPES, usecols = self.columns)
         if len(self.todos) == 0:
             return True
         
-        self.todos[RepoDataHeader.REPO] = self.handle
+        self.todos[RepoDataHeader.REPO] = pd.Categorical.from_codes(np.zeros(len(self.todos), dtype = np.int8),
+                                                                    categories = [self.handle])
         
-        blanks_zero = pd.isnull(self.todos[RepoDataHeader.TODO]).sum()
+        blanks_zero = (self.todos[RepoDataHeader.TODO].isna().sum() if RepoDataHeader.TODO in self.todos else 0)
         if blanks_zero > 0:
-            self.__violation("Todos can be NULL (" + str(added_zero) + " time(s))")
+            self.__violation("Todos can be NULL (" + str(blanks_zero) + " time(s))")
             
-        added_zero = pd.isnull(self.todos[RepoDataHeader.ADDED]).sum()
+        added_zero = (self.todos[RepoDataHeader.ADDED].isna().sum() if RepoDataHeader.ADDED in self.todos else 0)
         if added_zero > 0:
             self.__violation("Added can be NULL (" + str(added_zero) + " time(s))")
             
-        if len(self.todos[self.todos[RepoDataHeader.AGE] == 0]) > 0:
+        if RepoDataHeader.AGE in self.todos and (self.todos[RepoDataHeader.AGE] <= 0).any():
             self.__violation("Age can be 0 or less")
+        
+        for count in [RepoDataHeader.FILETOUCHES, RepoDataHeader.AUTHOR_UNION, RepoDataHeader.AUTHOR_INTERSECT]:
+            if count in self.todos and self.todos[count].isna().any():
+                self.__violation(count + " can be NULL")
 
         return True
         
@@ -87,20 +114,56 @@ class RepoDatumFileIO:
         return False
     
     def add_file_if_matches(self, filename):
-        if not self.__safe_handle in filename:
-            return False
-        if filename.endswith("_todos.csv"):
+        # Names are <run>_<safe handle>_todos.csv or _cloc.csv, the handle being a whole part of it
+        name = basename(filename)
+        if (name.endswith(("_" + self.__safe_handle + "_todos.csv", "_" + self.__safe_handle + "__todos.csv"))
+            or name.endswith(("_" + self.__safe_handle + "_todos.parquet", "_" + self.__safe_handle + "__todos.parquet"))):
             self.__todo_file = filename
-        elif filename.endswith("_cloc.csv"):
+        elif name.endswith(("_" + self.__safe_handle + "_cloc.csv", "_" + self.__safe_handle + "__cloc.csv")):
             self.__cloc_file = filename
         else:
             return False
         return True
     
+    def add_indexed_files(self, index):
+        files = index.get(self.__safe_handle, {})
+        for suffix in RepoDatumFileIO.DATA_SUFFIXES:
+            if suffix in files:
+                self.add_file_if_matches(files[suffix])
+    
+    def safe_handle(handle):
+        return handle.replace("/", "_").replace("\\", "_").strip()
+    
+    def index_data_dir(data_dir, handles):
+        # Lists the data directory once, mapping the safe handle of each of handles to its files.
+        # Run handles and safe handles can both hold underscores, so when a name could belong to
+        # more than one handle, the longest one wins.
+        safe_handles = set(RepoDatumFileIO.safe_handle(handle) for handle in handles)
+        index = {}
+        for filename in sorted(listdir(data_dir)):
+            for suffix in RepoDatumFileIO.DATA_SUFFIXES:
+                if not filename.endswith(suffix):
+                    continue
+                # todo_tab.py names its files <run>_<safe handle>__todos.csv, with two underscores
+                stems = [filename[:-len(suffix)]]
+                if stems[0].endswith("_"):
+                    stems.append(stems[0][:-1])
+                for stem in stems:
+                    pos = stem.find("_")
+                    while pos >= 0 and not stem[pos + 1:] in safe_handles:
+                        pos = stem.find("_", pos + 1)
+                    if pos >= 0:
+                        index.setdefault(stem[pos + 1:], {})[suffix] = join(data_dir, filename)
+                        break
+        return index
+    
     def get_sample_map(sample_list_filename):
         df = pd.read_csv(sample_list_filename, quotechar='"', sep=';', skipinitialspace=True)
         return df.set_index(RepoDataHeader.REPO).to_dict()[RepoDataHeader.SAMPLE]
     
+    def data_files(self):
+        return [self.__todo_file, self.__cloc_file]
+    
     def remove_files(self):
         remove(self.__todo_file)
         remove(self.__cloc_file)
@@ -114,8 +177,9 @@ class RepoDataSample:
                     print("Removing " + sample)
                     datum.remove_files()
         slf = rds.__sample_list_filename
+        data_dir = rds.data_dir
         del rds
-        return RepoDataSample(slf)
+        return RepoDataSample(slf, data_dir)
     
     def __violation(self, violation):
         self.violations.append(violation)
@@ -126,23 +190,39 @@ class RepoDataSample:
             if len(datum.violations) > 0:
                 print(datum.handle + ": \n\t" + "\n\t".join(datum.violations))
 
-    def __init__(self, sample_list_filename):
+    def __init__(self, sample_list_filename, data_dir = ".", jobs = None, columns = None):
         self.__sample_list_filename = sample_list_filename
+        self.data_dir = data_dir
         self.sample_map = RepoDatumFileIO.get_sample_map(sample_list_filename)
         self.violations = []
         self.datum_list = []
+        self.__events = None
+        self.__open_todos = {} # Map from (frequency, by) to open_todos' output
         
+        if columns != None: # Whatever else is pruned, the per repo calculations need these
+            columns = list(dict.fromkeys(list(columns) + [RepoDataHeader.ADDED, RepoDataHeader.DELETED,
+                                                          RepoDataHeader.AGE]))
+        
+        index = RepoDatumFileIO.index_data_dir(data_dir, self.sample_map.keys())
+        data = []
         for handle, sample in self.sample_map.items():
-            m = RepoDatumFileIO(handle)
-            for f in listdir("."):
-                m.add_file_if_matches(f)
-            if m.validate_and_read():
-                self.datum_list.append(m)
+            m = RepoDatumFileIO(handle, columns)
+            m.add_indexed_files(index)
+            data.append(m)
+        
+        # The csv parser does its work without the GIL, so threads read files side by side
+        with ThreadPoolExecutor(max_workers = jobs) as pool:
+            for m, read in zip(data, pool.map(RepoDatumFileIO.validate_and_read, data)):
+                if read:
+                    self.datum_list.append(m)
 
         self.combined_data = pd.concat(datum.todos for datum in self.datum_list)
         
         self.__agg_meta() # Add data from files
         self.__calc_per_repo() # Add data calculated
+        
+        for column in [RepoDataHeader.REPO, RepoDataHeader.SAMPLE]:
+            self.combined_data[column] = self.combined_data[column].astype("category")
     
     def missing_samples(self):
         out = []
@@ -172,7 +252,7 @@ class RepoDataSample:
         return output
     
     def data_by_repo(self):
-        g = self.combined_data.groupby(RepoDataHeader.REPO).agg({RepoDataHeader.DAYS_OF_DATA:['first'],
+        g = self.combined_data.groupby(RepoDataHeader.REPO, observed = True).agg({RepoDataHeader.DAYS_OF_DATA:['first'],
                                                         RepoDataHeader.SAMPLE:['first'],
                                                         RepoDataHeader.LOC:['first'],
                                                         RepoDataHeader.ADDED:['count'],
@@ -184,21 +264,108 @@ class RepoDataSample:
         g[RepoDataHeader.LOG + RepoDataHeader.LOC] = np.log(g[RepoDataHeader.LOC])
         return g
         
+    def open_todo_events(self):
+        # Every add (+1) and delete (-1) of a TODO as (repo codes, epochs, running open count),
+        # sorted by repo and then time, so that the count after each event is a cumulative sum.
+        # A TODO whose add wasn't seen is open from the first event of its repo.
+        if self.__events != None:
+            return self.__events
+        q = self.combined_data
+        codes = q[RepoDataHeader.REPO].cat.codes.to_numpy(dtype = np.int64)
+        added = CommitInfo.epochs_from_human_readable(q[RepoDataHeader.ADDED]).to_numpy(dtype = np.float64)
+        deleted = CommitInfo.epochs_from_human_readable(q[RepoDataHeader.DELETED]).to_numpy(dtype = np.float64)
+        first = q.groupby(RepoDataHeader.REPO, observed = True)["minepoch"].transform("min").to_numpy(dtype = np.float64)
+        added = np.where(np.isnan(added), first, added)
+        closed = ~np.isnan(deleted)
+        event_codes = np.concatenate([codes, codes[closed]])
+        epochs = np.concatenate([added, deleted[closed]])
+        deltas = np.concatenate([np.ones(len(added), dtype = np.int64), np.full(closed.sum(), -1, dtype = np.int64)])
+        order = np.lexsort((epochs, event_codes))
+        self.__events = (event_codes[order], epochs[order], np.cumsum(deltas[order]))
+        return self.__events
+    
+    def __sweep(self, dates):
+        # Open TODOs of every repo at every one of dates, as a repos by dates array. Each count is
+        # the running count of the last event of the repo up to the date, found by binary search
+        # over keys ordering events by repo and then time.
+        event_codes, epochs, running = self.open_todo_events()
+        categories = self.combined_data[RepoDataHeader.REPO].cat.categories
+        if len(epochs) == 0 or len(dates) == 0:
+            return np.zeros((len(categories), len(dates)), dtype = np.int64)
+        origin = epochs.min()
+        span = max(epochs.max(), dates.max()) - origin + 1
+        keys = event_codes * span + (epochs - origin)
+        repo_codes = np.arange(len(categories))
+        starts = np.searchsorted(keys, repo_codes * span, side = "left") # First event of each repo
+        before = np.concatenate([[0], running])[starts] # Running count before the repo's events
+        queries = repo_codes[:, None] * span + np.clip(dates[None, :] - origin, -1, None)
+        last = np.searchsorted(keys, queries, side = "right") - 1
+        counts = np.concatenate([[0], running])[last + 1] - before[:, None]
+        return np.where(last >= starts[:, None], counts, 0)
+    
+    def open_todos(self, frequency = "MS", by = RepoDataHeader.REPO, cache = True):
+        # The number of TODOs open at the end of each period from the first event of the sample to
+        # its last, labelled by the period's start, at the given pandas frequency (eg. "D", "W",
+        # "MS"), per repo or per Sample, with their density per thousand lines of code. Kept on this
+        # object, and in the data directory for as long as the sample list and data files read are
+        # unchanged.
+        key = (frequency, by)
+        if key in self.__open_todos:
+            return self.__open_todos[key]
+        cache_file = join(self.data_dir, "open_todos_" + by + "_" + frequency + ".pkl")
+        fingerprint = self.__fingerprint(key)
+        if cache and isfile(cache_file):
+            cached = pd.read_pickle(cache_file)
+            if cached["fingerprint"] == fingerprint:
+                self.__open_todos[key] = cached["open_todos"]
+                return cached["open_todos"]
+        
+        _, epochs, _ = self.open_todo_events()
+        offset = pd.tseries.frequencies.to_offset(frequency)
+        if len(epochs) == 0:
+            dates = pd.DatetimeIndex([], name = RepoDataHeader.DATE)
+        else:
+            # From the start of the period holding the first event, so that period is counted too
+            first = offset.rollback(pd.to_datetime(epochs.min(), unit = "s").floor("D"))
+            dates = pd.date_range(first, pd.to_datetime(epochs.max(), unit = "s"), freq = frequency,
+                                  name = RepoDataHeader.DATE)
+        # Each period counts every event before the next one starts
+        ends = ((dates + offset - pd.Timestamp(0)) / pd.Timedelta(seconds = 1)).to_numpy() - 1
+        per_repo = self.combined_data.groupby(RepoDataHeader.REPO, observed = False)[
+            [RepoDataHeader.LOC, RepoDataHeader.SAMPLE]].first()
+        open_counts = pd.DataFrame(self.__sweep(ends), index = per_repo.index, columns = dates)
+        kloc = per_repo[RepoDataHeader.LOC] / 1000
+        if by != RepoDataHeader.REPO:
+            open_counts = open_counts.groupby(per_repo[by], observed = True).sum()
+            kloc = kloc.groupby(per_repo[by], observed = True).sum()
+        output = open_counts.stack().rename(RepoDataHeader.OPEN).reset_index()
+        output[RepoDataHeader.OPEN_PER_KLOC] = (output[RepoDataHeader.OPEN]
+                                                / kloc.where(kloc > 0).reindex(output[by]).to_numpy())
+        
+        self.__open_todos[key] = output
+        if cache:
+            pd.to_pickle({"fingerprint": fingerprint, "open_todos": output}, cache_file + ".tmp")
+            replace(cache_file + ".tmp", cache_file)
+        return output
+    
+    def __fingerprint(self, key):
+        # What open_todos' output depends on: its arguments, the sample list and the data files read
+        files = sorted((name, getmtime(name), getsize(name)) for datum in self.datum_list for name in datum.data_files())
+        return repr((key, sorted(self.sample_map.items()), files))
+    
     # For now, just days of data. Also want: closed vs open only todos
     def __calc_per_repo(self):
-        to_epoch = CommitInfo.epoch_from_human_readable
+
         q = self.combined_data
-        q["minepoch"] = q.apply(lambda x: min(to_epoch(x[RepoDataHeader.ADDED], x[RepoDataHeader.DELETED]),
-                                              to_epoch(x[RepoDataHeader.DELETED], x[RepoDataHeader.ADDED])), axis = 1)
-        q["maxepoch"] = q.apply(lambda x: max(to_epoch(x[RepoDataHeader.ADDED], x[RepoDataHeader.DELETED]),
-                                              to_epoch(x[RepoDataHeader.DELETED], x[RepoDataHeader.ADDED])), axis = 1)
-        q = q.groupby(RepoDataHeader.REPO).agg({"minepoch":['min'],"maxepoch":['max']})
-        q.columns = [' '.join(col).strip() for col in q.columns.values]
-        q[RepoDataHeader.DAYS_OF_DATA] = (q["maxepoch max"] - q["minepoch min"]) / 60 / 60 / 24
-        q[RepoDataHeader.REPO] = q.index
-        q = q[[RepoDataHeader.REPO, RepoDataHeader.DAYS_OF_DATA]]
-        self.combined_data = pd.merge(left=self.combined_data, right=q,
-                      left_on=RepoDataHeader.REPO, right_on=RepoDataHeader.REPO)
+        added = CommitInfo.epochs_from_human_readable(q[RepoDataHeader.ADDED])
+        deleted = CommitInfo.epochs_from_human_readable(q[RepoDataHeader.DELETED])
+        # A missing side falls back on the other one, and 0 if both are missing
+        added, deleted = added.fillna(deleted).fillna(0), deleted.fillna(added).fillna(0)
+        q["minepoch"] = np.minimum(added, deleted)
+        q["maxepoch"] = np.maximum(added, deleted)
+        by_repo = q.groupby(RepoDataHeader.REPO, sort = False, observed = True)
+        q[RepoDataHeader.DAYS_OF_DATA] = (by_repo["maxepoch"].transform("max")
+                                          - by_repo["minepoch"].transform("min")) / 60 / 60 / 24
         
     def __agg_meta(self):
         
@@ -0,0 +1,138 @@
+import unittest
+from rds import RepoDataSample, RepoDataHeader, RepoDatumFileIO
+from todos import CommitInfo
+from todo_tab import write_parquet_table
+import os, tempfile, shutil
+import importlib.util
+import pandas as pd
+
+TODOS_HEADER = "repo,todo ID,Added,Deleted,Age,Filetouches,Author Union,Author Intersect,safe body,safe contexts,filepaths\n"
+
+SAMPLE_TODOS = {
+    "me/one": ['me/one,0,"Thu, 24 Nov 2016 15:06","Sat, 26 Nov 2016 15:06",2.0,3,1,1,# TODO a,# TODO a,a.py\n',
+               'me/one,1,"Fri, 25 Nov 2016 15:06",N/A,5.0,3,1,0,// FIXME b,// FIXME b,b.c\n',
+               'me/one,2,N/A,"Tue, 29 Nov 2016 10:00",3.0,1,1,0,// todo c,// todo c,b.c\n'],
+    "me/one_two": ['me/one_two,0,"Sun, 12 Mar 2017 01:30","Sun, 02 Apr 2017 23:59",21.9,2,2,1,TODO d,TODO d,d.py\n'],
+}
+
+SAMPLE_CLOC = "cloc v 1.70\nfiles,language,blank,comment,code\n3,Python,10,5,100\n1,C,2,1,20\n"
+
+def write_sample_data(data_dir, run_handle = "run", todos = SAMPLE_TODOS):
+    # Writes the todos and cloc files todo_tab.py and cloc would leave for each repo, plus the
+    # sample list naming them
+    for handle, rows in todos.items():
+        prefix = os.path.join(data_dir, run_handle + "_" + handle.replace("/", "_") + "_")
+        with open(prefix + "todos.csv", "w") as f:
+            f.write(TODOS_HEADER + "".join(rows))
+        with open(prefix + "cloc.csv", "w") as f:
+            f.write(SAMPLE_CLOC)
+    sample_list = os.path.join(data_dir, "samples.csv")
+    with open(sample_list, "w") as f:
+        f.write("repo;Sample\n" + "".join(handle + ";Top10\n" for handle in todos))
+    return sample_list
+
+class RepoDataSampleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sample_list = write_sample_data(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_data_dir_index(self):
+        write_sample_data(self.tmp.name, "late_run", {"me/one": SAMPLE_TODOS["me/one"][:1]})
+        index = RepoDatumFileIO.index_data_dir(self.tmp.name, ["me/one", "me/one_two", "one/two"])
+        self.assertEqual(sorted(index.keys()), ["me_one", "me_one_two"])
+        self.assertEqual(os.path.basename(index["me_one"]["_todos.csv"]), "run_me_one_todos.csv")
+        self.assertEqual(os.path.basename(index["me_one_two"]["_cloc.csv"]), "run_me_one_two_cloc.csv")
+
+    def test_typed_load(self):
+        rds = RepoDataSample(self.sample_list, self.tmp.name, jobs = 2)
+        data = rds.combined_data
+        self.assertIsInstance(data[RepoDataHeader.REPO].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(data[RepoDataHeader.SAMPLE].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_float_dtype(data[RepoDataHeader.AGE]))
+        self.assertTrue(pd.api.types.is_integer_dtype(data[RepoDataHeader.FILETOUCHES]))
+        self.assertEqual(list(data[RepoDataHeader.REPO]), ["me/one"] * 3 + ["me/one_two"])
+        self.assertEqual(rds.violating_samples(), ["me/one"]) # Added is N/A in one row
+        self.assertEqual(rds.data_by_repo()[RepoDataHeader.ADDED].to_dict(), {"me/one": 2, "me/one_two": 1})
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "needs pyarrow")
+    def test_parquet_matches_csv(self):
+        parquet_dir = os.path.join(self.tmp.name, "parquet")
+        os.mkdir(parquet_dir)
+        for handle in SAMPLE_TODOS:
+            prefix = "run_" + handle.replace("/", "_")
+            rows = pd.read_csv(os.path.join(self.tmp.name, prefix + "_todos.csv"), dtype = str, keep_default_na = False)
+            write_parquet_table(os.path.join(parquet_dir, prefix + "_todos.parquet"), list(rows.columns),
+                                rows.values.tolist(), RepoDataHeader.TODO_DTYPES)
+            shutil.copy(os.path.join(self.tmp.name, prefix + "_cloc.csv"), parquet_dir)
+        from_csv = RepoDataSample(self.sample_list, self.tmp.name).combined_data
+        from_parquet = RepoDataSample(self.sample_list, parquet_dir).combined_data
+        pd.testing.assert_frame_equal(from_csv, from_parquet)
+        pruned = RepoDataSample(self.sample_list, parquet_dir, columns = [RepoDataHeader.FILETOUCHES]).combined_data
+        self.assertNotIn(RepoDataHeader.TODO, pruned)
+        pd.testing.assert_series_equal(from_csv[RepoDataHeader.DAYS_OF_DATA], pruned[RepoDataHeader.DAYS_OF_DATA])
+
+    def test_days_of_data(self):
+        rds = RepoDataSample(self.sample_list, self.tmp.name)
+        data = rds.combined_data
+        self.assertEqual(len(data), 4)
+        to_epoch = CommitInfo.epoch_from_human_readable
+        for _, row in data.iterrows():
+            self.assertEqual(row["minepoch"], min(to_epoch(row[RepoDataHeader.ADDED], row[RepoDataHeader.DELETED]),
+                                                  to_epoch(row[RepoDataHeader.DELETED], row[RepoDataHeader.ADDED])))
+            self.assertEqual(row["maxepoch"], max(to_epoch(row[RepoDataHeader.ADDED], row[RepoDataHeader.DELETED]),
+                                                  to_epoch(row[RepoDataHeader.DELETED], row[RepoDataHeader.ADDED])))
+        days = data.groupby(RepoDataHeader.REPO)[RepoDataHeader.DAYS_OF_DATA].first()
+        self.assertAlmostEqual(days["me/one"], (to_epoch("Tue, 29 Nov 2016 10:00") - to_epoch("Thu, 24 Nov 2016 15:06")) / 86400)
+        self.assertAlmostEqual(days["me/one_two"], (to_epoch("Sun, 02 Apr 2017 23:59") - to_epoch("Sun, 12 Mar 2017 01:30")) / 86400)
+        self.assertEqual(CommitInfo.human_readable_from_epoch(to_epoch("Sun, 12 Mar 2017 01:30")), "Sun, 12 Mar 2017 01:30")
+
+    def test_open_todos(self):
+        rds = RepoDataSample(self.sample_list, self.tmp.name)
+        by_repo = rds.open_todos("D")
+        # The same counts by scanning every TODO at the end of every day
+        data = rds.combined_data
+        first = data.groupby(RepoDataHeader.REPO, observed = True)["minepoch"].min()
+        for _, row in by_repo.sample(20, random_state = 0).iterrows():
+            todos = data[data[RepoDataHeader.REPO] == row[RepoDataHeader.REPO]]
+            epoch = (row[RepoDataHeader.DATE] + pd.Timedelta(days = 1) - pd.Timestamp(0)).total_seconds() - 1
+            added = CommitInfo.epochs_from_human_readable(todos[RepoDataHeader.ADDED]).fillna(first[row[RepoDataHeader.REPO]])
+            deleted = CommitInfo.epochs_from_human_readable(todos[RepoDataHeader.DELETED])
+            self.assertEqual(row[RepoDataHeader.OPEN], ((added <= epoch) & ~(deleted <= epoch)).sum())
+        self.assertEqual(len(by_repo), 2 * 130)
+        self.assertAlmostEqual(by_repo[RepoDataHeader.OPEN_PER_KLOC].max(), 3 / 0.12)
+        by_sample = rds.open_todos("D", RepoDataHeader.SAMPLE)
+        self.assertEqual(list(by_sample[RepoDataHeader.OPEN]),
+                         list(by_repo.groupby(RepoDataHeader.DATE)[RepoDataHeader.OPEN].sum()))
+        # A fresh load reads the cache, until a data file changes
+        self.assertIs(rds.open_todos("D"), by_repo)
+        cached = RepoDataSample(self.sample_list, self.tmp.name).open_todos("D")
+        pd.testing.assert_frame_equal(cached, by_repo)
+        write_sample_data(self.tmp.name, todos = {"me/one": SAMPLE_TODOS["me/one"][:1], "me/one_two": SAMPLE_TODOS["me/one_two"]})
+        changed = RepoDataSample(self.sample_list, self.tmp.name).open_todos("D")
+        self.assertEqual(changed[RepoDataHeader.OPEN].max(), 1)
+
+    def test_open_todos_in_one_period(self):
+        # The first partial month of a longer span is kept
+        both = RepoDataSample(self.sample_list, self.tmp.name).open_todos("MS", cache = False)
+        self.assertEqual(both[RepoDataHeader.DATE].min(), pd.Timestamp("2016-11-01"))
+        self.assertEqual(both[RepoDataHeader.DATE].nunique(), 6)
+        two = both[both[RepoDataHeader.REPO] == "me/one_two"].set_index(RepoDataHeader.DATE)[RepoDataHeader.OPEN]
+        self.assertEqual(two[pd.Timestamp("2017-03-01")], 1)
+        self.assertEqual(two[pd.Timestamp("2017-04-01")], 0)
+        # All of me/one's TODOs come and go within November 2016, which is still a period of its
+        # own. By its end two of the three are gone again.
+        sample_list = write_sample_data(self.tmp.name, todos = {"me/one": SAMPLE_TODOS["me/one"]})
+        rds = RepoDataSample(sample_list, self.tmp.name)
+        monthly = rds.open_todos("MS", cache = False)
+        self.assertEqual(list(monthly[RepoDataHeader.DATE]), [pd.Timestamp("2016-11-01")])
+        self.assertEqual(list(monthly[RepoDataHeader.OPEN]), [1])
+        yearly = rds.open_todos("YS", cache = False)
+        self.assertEqual(list(yearly[RepoDataHeader.DATE]), [pd.Timestamp("2016-01-01")])
+        self.assertEqual(list(yearly[RepoDataHeader.OPEN]), [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+from git import Repo
+from todos import TodoMatcher, LogFileDiff
+import argparse, csv, os, pickle, re, sys
+
+class SlocCounter:
+    # Physical, source, comment and TODO line counts of single files, by the comment syntax of
+    # their language. Counts are kept per blob, so a file is only ever read and counted once.
+
+    HEADERS = ["Path", "Physical", "Source", "Comment", "Single-line comment", "Block comment",
+               "Mixed", "Empty", "To Do", "Regex"]
+    DEFAULT_REGEX = "^.*(TODO|FIXME).*$"
+
+    # Line comment starts, and (start, end) pairs of block comments, per language
+    C_STYLE = (["//"], [("/*", "*/")])
+    HASH_STYLE = (["#"], [])
+    SYNTAX = {
+        "C": C_STYLE, "C++": C_STYLE, "C/C++ Header": C_STYLE, "C#": C_STYLE, "Objective-C": C_STYLE,
+        "Java": C_STYLE, "Scala": C_STYLE, "Kotlin": C_STYLE, "Groovy": C_STYLE, "Go": C_STYLE,
+        "Rust": C_STYLE, "Swift": C_STYLE, "Dart": C_STYLE, "JavaScript": C_STYLE,
+        "TypeScript": C_STYLE, "SCSS": C_STYLE, "LESS": C_STYLE,
+        "CSS": ([], [("/*", "*/")]),
+        "PHP": (["//", "#"], [("/*", "*/")]),
+        "Python": (["#"], [('"""', '"""'), ("'''", "'''")]),
+        "Ruby": (["#"], [("=begin", "=end")]),
+        "Perl": (["#"], [("=pod", "=cut")]),
+        "Julia": (["#"], [("#=", "=#")]),
+        "CoffeeScript": (["#"], [("###", "###")]),
+        "Bourne Shell": HASH_STYLE, "R": HASH_STYLE, "YAML": HASH_STYLE, "make": HASH_STYLE,
+        "CMake": HASH_STYLE, "Elixir": HASH_STYLE,
+        "Lua": (["--"], [("--[[", "]]")]),
+        "SQL": (["--"], [("/*", "*/")]),
+        "Haskell": (["--"], [("{-", "-}")]),
+        "Erlang": (["%"], []),
+        "MATLAB": (["%"], [("%{", "%}")]),
+        "Lisp": ([";"], []), "Clojure": ([";"], []),
+        "HTML": ([], [("<!--", "-->")]), "XML": ([], [("<!--", "-->")]),
+    }
+    EXTENSIONS = {
+        ".c": "C", ".cc": "C++", ".cpp": "C++", ".cxx": "C++", ".c++": "C++", ".h": "C/C++ Header",
+        ".hh": "C/C++ Header", ".hpp": "C/C++ Header", ".hxx": "C/C++ Header", ".cs": "C#",
+        ".m": "Objective-C", ".mm": "Objective-C", ".java": "Java", ".scala": "Scala", ".kt": "Kotlin",
+        ".kts": "Kotlin", ".groovy": "Groovy", ".gradle": "Groovy", ".go": "Go", ".rs": "Rust",
+        ".swift": "Swift", ".dart": "Dart", ".js": "JavaScript", ".jsx": "JavaScript",
+        ".mjs": "JavaScript", ".ts": "TypeScript", ".tsx": "TypeScript", ".scss": "SCSS",
+        ".less": "LESS", ".css": "CSS", ".php": "PHP", ".py": "Python", ".rb": "Ruby", ".pl": "Perl",
+        ".pm": "Perl", ".jl": "Julia", ".coffee": "CoffeeScript", ".sh": "Bourne Shell",
+        ".bash": "Bourne Shell", ".r": "R", ".yml": "YAML", ".yaml": "YAML", ".mk": "make",
+        ".cmake": "CMake", ".ex": "Elixir", ".exs": "Elixir", ".lua": "Lua", ".sql": "SQL",
+        ".hs": "Haskell", ".erl": "Erlang", ".lisp": "Lisp", ".el": "Lisp", ".clj": "Clojure",
+        ".html": "HTML", ".htm": "HTML", ".xml": "XML",
+    }
+    FILENAMES = {"Makefile": "make", "makefile": "make", "GNUmakefile": "make",
+                 "CMakeLists.txt": "CMake", "Rakefile": "Ruby", "Gemfile": "Ruby"}
+
+    def __init__(self, regex = DEFAULT_REGEX, matcher = None):
+        self.regex = re.compile(regex)
+        self.matcher = (TodoMatcher() if matcher == None else matcher)
+        self.blob_counts = {} # Map from (blob sha, language) to the counts of that blob
+        self.blobs_read = 0 # Blobs counted, rather than found in blob_counts
+
+    def language(path):
+        # None for files in no language we know the comments of, which aren't counted
+        name = path.rsplit("/", 1)[-1]
+        language = SlocCounter.FILENAMES.get(name)
+        if language == None:
+            language = SlocCounter.EXTENSIONS.get(os.path.splitext(name)[1].lower())
+        return language
+
+    def blob_counts_of(self, repo, sha, language):
+        key = (sha, language)
+        if key not in self.blob_counts:
+            data = repo.odb.stream(bytes.fromhex(sha)).read()
+            self.blobs_read += 1
+            # Binary files aren't source, whatever their name
+            self.blob_counts[key] = (None if b"\0" in data[:8000]
+                                     else self.count(data.decode("utf-8", "replace"), language))
+        return self.blob_counts[key]
+
+    def load_cache(self, path):
+        # Takes in the blob counts an earlier run saved, if it counted To Do and Regex alike
+        if not os.path.isfile(path):
+            return False
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state["regex"] != self.regex.pattern or state["tokens"] != self.matcher.pattern.pattern:
+            return False
+        self.blob_counts.update(state["blob_counts"])
+        return True
+
+    def save_cache(self, path):
+        state = {"regex": self.regex.pattern, "tokens": self.matcher.pattern.pattern,
+                 "blob_counts": self.blob_counts}
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def earliest_comment(line, pos, line_starts, blocks):
+        # (start, opener, closer) of the first comment from pos on, closer being None for a line
+        # comment, or start -1. Of openers at the same place the longest wins, as "--[[" over "--".
+        found = (-1, None, None)
+        for opener, closer in [(start, None) for start in line_starts] + blocks:
+            start = line.find(opener, pos)
+            if start >= 0 and (found[0] < 0 or start < found[0]
+                               or (start == found[0] and len(opener) > len(found[1]))):
+                found = (start, opener, closer)
+        return found
+
+    def count(self, text, language):
+        # A line is empty when blank, source when holding any code, comment when holding any
+        # comment, and mixed when both. Comment lines are single-line or block comments by the
+        # kind of comment on them, and To Do when a comment line holds a TODO token.
+        line_starts, blocks = SlocCounter.SYNTAX[language]
+        physical = source = comment = single = block = mixed = empty = todo = matched = 0
+        block_end = None
+        lines = text.split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        for line in lines:
+            physical += 1
+            if self.regex.search(line.rstrip("\r")) != None:
+                matched += 1
+            if line.strip() == "":
+                empty += 1
+                continue
+            has_code = has_single = has_block = False
+            pos = 0
+            while pos < len(line):
+                if block_end != None:
+                    has_block = True
+                    end = line.find(block_end, pos)
+                    if end < 0:
+                        break
+                    pos = end + len(block_end)
+                    block_end = None
+                    continue
+                start, opener, closer = SlocCounter.earliest_comment(line, pos, line_starts, blocks)
+                if line[pos:(len(line) if start < 0 else start)].strip() != "":
+                    has_code = True
+                if start < 0:
+                    break
+                if closer == None:
+                    has_single = True
+                    break
+                has_block = True
+                block_end = closer
+                pos = start + len(opener)
+            has_comment = has_single or has_block
+            source += has_code
+            comment += has_comment
+            single += has_single
+            block += has_block
+            mixed += (has_code and has_comment)
+            todo += (has_comment and self.matcher.pattern.search(line) != None)
+        return (physical, source, comment, single, block, mixed, empty, todo, matched)
+
+class SlocHistory:
+    # Per commit line counts down the first-parent history, as sh/bba.sh used to produce by
+    # checking out and scanning every commit. The counts of the newest commit's tree are worked
+    # out once; from there each older commit only recounts the blobs its diff touches.
+
+    HEADERS = ["Commit", "Date", "Parent1", "Parent2"] + SlocCounter.HEADERS
+    CLOC_HEADERS = ["files", "language", "blank", "comment", "code"]
+    LOG_FORMAT = "%x00%H%x00%ai%x00%P"
+    REGULAR_MODES = ["100644", "100755"] # Symlinks and submodules have no lines
+
+    def __init__(self, repo, counter = None):
+        self.repo = repo
+        self.counter = (SlocCounter() if counter == None else counter)
+        self.files = {} # Map from path to the counts of that file in the current commit
+        self.totals = [0] * (len(SlocCounter.HEADERS) - 1)
+
+    def set_file(self, path, mode, sha):
+        old = self.files.pop(path, None)
+        if old != None:
+            self.totals = [total - count for total, count in zip(self.totals, old)]
+        language = SlocCounter.language(path)
+        if language == None or mode not in SlocHistory.REGULAR_MODES:
+            return
+        counts = self.counter.blob_counts_of(self.repo, sha, language)
+        if counts != None:
+            self.files[path] = counts
+            self.totals = [total + count for total, count in zip(self.totals, counts)]
+
+    def load_tree(self, rev):
+        self.files = {}
+        self.totals = [0] * (len(SlocCounter.HEADERS) - 1)
+        for entry in self.repo.git.ls_tree(rev, r = True, full_tree = True, z = True).split("\0"):
+            if entry:
+                mode_type_sha, path = entry.split("\t", 1)
+                mode, _, sha = mode_type_sha.split(" ")
+                self.set_file(path, mode, sha)
+
+    def row(self, hexsha, date, parents):
+        parents = parents + [""] * (2 - len(parents))
+        return [hexsha, date, parents[0], parents[1], "."] + self.totals
+
+    def iter_rows(self, rev = "HEAD", max_count = -1):
+        # Newest commit first, as git log lists them. Each commit's row is yielded before its
+        # diff is undone, which leaves the files as they were in its first parent.
+        self.load_tree(rev)
+        log_args = {"first_parent": True, "diff_merges": "first-parent", "raw": True,
+                    "no_renames": True, "no_abbrev": True, "format": SlocHistory.LOG_FORMAT,
+                    "as_process": True}
+        if max_count > 0:
+            log_args["max_count"] = max_count
+        self.repo.git(c = ["core.quotePath=false"])
+        proc = self.repo.git.log(rev, **log_args)
+        undo = []
+        for line in proc.stdout:
+            if line.startswith(b"\x00"):
+                self.undo_diff(undo)
+                undo = []
+                _, hexsha, date, parents = line.decode("utf-8", "replace").rstrip("\n").split("\x00")
+                yield self.row(hexsha, date, parents.split())
+            elif line.startswith(b":"):
+                modes_shas, path = line.split(b"\t", 1)
+                old_mode, _, old_sha, _, _ = modes_shas[1:].decode("ascii").split(" ")
+                undo.append((LogFileDiff.unquote(path), old_mode, old_sha))
+        proc.wait()
+
+    def undo_diff(self, undo):
+        for path, old_mode, old_sha in undo:
+            self.set_file(path, old_mode, old_sha)
+
+    def language_rows(self):
+        # The files of the current commit summed by language the way cloc reports them, most code
+        # first. cloc counts a line holding both code and a comment as code.
+        by_language = {}
+        for path, counts in self.files.items():
+            language = SlocCounter.language(path)
+            physical, source, comment, single, block, mixed, empty, todo, matched = counts
+            row = by_language.setdefault(language, [0, language, 0, 0, 0])
+            row[0] += 1
+            row[2] += empty
+            row[3] += comment - mixed
+            row[4] += source
+        return sorted(by_language.values(), key = lambda row: (-row[4], row[1]))
+
+    def write_cloc(self, f, rev = "HEAD"):
+        # The lines of rev's tree in the shape of cloc --csv, less its SUM row, as RepoDataSample reads
+        self.load_tree(rev)
+        f.write("sloc.py\n")
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(SlocHistory.CLOC_HEADERS)
+        writer.writerows(self.language_rows())
+
+    def write_csv(self, f, rev = "HEAD", max_count = -1):
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(SlocHistory.HEADERS)
+        writer.writerows(self.iter_rows(rev, max_count))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Line counts of every first-parent commit of a repository.')
+    parser.add_argument('repo', help='directory of the repository')
+    parser.add_argument('regex', nargs='?', default=SlocCounter.DEFAULT_REGEX,
+                        help='lines matching this count towards the Regex column (default: ' +
+                        SlocCounter.DEFAULT_REGEX + ')')
+    parser.add_argument('--rev', dest='rev', default="HEAD",
+                        help='commit to walk back from (default: HEAD)')
+    parser.add_argument('--maxCount', dest='max_count', default=-1,
+                        help='max number of commits to count (default: no limit, or -1)')
+    parser.add_argument('--cloc', dest='cloc', action='store_true',
+                        help='only count the tree of --rev, by language, in the csv format of cloc')
+    parser.add_argument('--cache', dest='cache', default=None,
+                        help='keep the counts of every blob in this file, so later runs only count new ones')
+    args = parser.parse_args()
+
+    counter = SlocCounter(args.regex)
+    if args.cache != None:
+        counter.load_cache(args.cache)
+    history = SlocHistory(Repo(args.repo), counter)
+    if args.cloc:
+        history.write_cloc(sys.stdout, args.rev)
+    else:
+        history.write_csv(sys.stdout, args.rev, int(args.max_count))
+    if args.cache != None:
+        counter.save_cache(args.cache)
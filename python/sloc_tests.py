@@ -0,0 +1,66 @@
+import unittest
+from sloc import SlocCounter, SlocHistory
+from todo_tests import make_git_repo, SAMPLE_HISTORY
+from git import Repo
+import io, tempfile, os
+
+C_SOURCE = """int x; // TODO tidy
+/* a block
+   comment */
+
+int y; /* both */ int z;
+// FIXME
+"""
+
+class SlocCounterTests(unittest.TestCase):
+
+    def test_count(self):
+        counter = SlocCounter()
+        measures = dict(zip(SlocCounter.HEADERS[1:], counter.count(C_SOURCE, "C")))
+        self.assertEqual(measures, {"Physical": 6, "Source": 2, "Comment": 5, "Single-line comment": 2,
+                                    "Block comment": 3, "Mixed": 2, "Empty": 1, "To Do": 2, "Regex": 2})
+        python = counter.count('"""Doc\nstring"""\nx = 1  # todo\n', "Python")
+        self.assertEqual(python, (3, 1, 3, 1, 2, 1, 0, 1, 0))
+        self.assertEqual(SlocCounter.language("src/Makefile"), "make")
+        self.assertEqual(SlocCounter.language("a/B.CPP"), "C++")
+        self.assertEqual(SlocCounter.language("README"), None)
+
+class SlocHistoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = Repo(make_git_repo(os.path.join(self.tmp.name, "repo"), SAMPLE_HISTORY * 2))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_counting_each_tree(self):
+        history = SlocHistory(self.repo)
+        rows = list(history.iter_rows())
+        self.assertEqual([row[0] for row in rows], [commit.hexsha for commit in self.repo.iter_commits(first_parent = True)])
+        self.assertEqual(rows[-1][2:4], ["", ""])
+        recount = SlocHistory(self.repo)
+        for row in rows:
+            recount.load_tree(row[0])
+            self.assertEqual(row[5:], recount.totals)
+        # The walk reads each version of a file once, and the trees hold no others
+        self.assertEqual(history.counter.blob_counts, recount.counter.blob_counts)
+
+    def test_cloc_rows_reuse_blob_counts(self):
+        cache = os.path.join(self.tmp.name, "blobs.pkl")
+        history = SlocHistory(self.repo)
+        out = io.StringIO()
+        history.write_cloc(out)
+        self.assertEqual(out.getvalue(), "sloc.py\nfiles,language,blank,comment,code\n1,C,0,1,1\n1,Python,0,0,1\n")
+        self.assertEqual(history.counter.blobs_read, 2)
+        history.counter.save_cache(cache)
+        # Another run takes the counts in rather than reading the blobs again
+        again = SlocCounter()
+        self.assertTrue(again.load_cache(cache))
+        SlocHistory(self.repo, again).write_cloc(io.StringIO())
+        self.assertEqual(again.blobs_read, 0)
+        # Counts of another regex are no use
+        self.assertFalse(SlocCounter("FIXME").load_cache(cache))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+from todos import TodoArgs, CommitInfo
+from rds import RepoDatumFileIO, RepoDataHeader
+from itertools import islice
+import argparse, csv, datetime, os
+import sqlite3
+
+class SqlLoader:
+    # Loads the outputs of a mining run into the tables of sql/schema.sql: each repo's todos and
+    # summary from todo_tab.py, and its per commit line counts from bba.sh. Rows go in a batch
+    # per INSERT statement, and many batches per transaction.
+
+    BATCH_ROWS = 500 # Rows per INSERT statement
+    TRANSACTION_ROWS = 50000 # Rows per transaction
+    SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "sql")
+    SQL_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+    SLOC_DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z" # git's %ai, as bba.sh writes it
+
+    COMMIT_COLUMNS = ["repo_id", "commit_hash", "commit_date", "parent_commit_1", "parent_commit_2",
+                      "physical_lines", "source_lines", "comment_lines", "single_line_comment",
+                      "block_comment", "mixed_comment", "empty", "todo_lines", "regex_lines"]
+    TODO_COLUMNS = ["repo_id", "todo_id", "added", "deleted", "age", "filetouches", "author_union",
+                    "author_intersect", "body", "contexts", "filepaths"]
+    # Sums over the commits of a repo in a month, from which the averages and deviations the
+    # interesting queries take over commits add up for any grouping of months
+    ROLLUP_COLUMNS = ["repo_id", "sample", "commit_year", "commit_month", "commits", "density_commits",
+                      "todo_density_sum", "todo_density_sumsq", "comment_density_sum",
+                      "source_density_commits", "source_todo_density_sum"]
+    # Map from the header of a _summary.csv column to its column in repo_summaries
+    SUMMARY_COLUMNS = {"Total Commits": "total_commits", "Earliest Commit Epoch": "earliest_commit_epoch",
+                       "Latest Commit Epoch": "latest_commit_epoch", "Days of Data": "days_of_data",
+                       "Commits from Top 1 Author": "top_1_author_commits",
+                       "Commits from Top 25% Authors": "top_25_authors_commits",
+                       "Commits from Top 50% Authors": "top_50_authors_commits",
+                       "Commits from Top 75% Authors": "top_75_authors_commits",
+                       "Commits from All Authors": "all_authors_commits",
+                       "Author Gini": "author_gini", "Bus Factor": "bus_factor"}
+
+    def __init__(self, connection, placeholder = "?"):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.placeholder = placeholder # Parameter marker of the database's driver
+        self.pending_rows = 0 # Rows inserted since the last commit
+        self.loaded = {} # Map from table to the number of rows loaded into it
+
+    def sqlite(path):
+        # The stand-in for the MySQL database, with the same tables
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        with open(os.path.join(SqlLoader.SQL_DIR, "schema_sqlite.sql")) as f:
+            connection.executescript(f.read())
+        return SqlLoader(connection)
+
+    def mysql(host, user, password, database):
+        # The tables are expected to exist already, from sql/schema.sql
+        import pymysql # Only needed to load into MySQL
+        connection = pymysql.connect(host = host, user = user, password = password,
+                                     database = database, charset = "utf8mb4")
+        return SqlLoader(connection, "%s")
+
+    def insert_statement(self, table, columns, row_count):
+        values = "(" + ",".join([self.placeholder] * len(columns)) + ")"
+        return ("INSERT INTO " + table + " (" + ",".join(columns) + ") VALUES "
+                + ",".join([values] * row_count))
+
+    def insert_rows(self, table, columns, rows):
+        rows = iter(rows)
+        full_batch = self.insert_statement(table, columns, SqlLoader.BATCH_ROWS)
+        while True:
+            batch = list(islice(rows, SqlLoader.BATCH_ROWS))
+            if len(batch) == 0:
+                break
+            statement = (full_batch if len(batch) == SqlLoader.BATCH_ROWS
+                         else self.insert_statement(table, columns, len(batch)))
+            self.cursor.execute(statement, [value for row in batch for value in row])
+            self.loaded[table] = self.loaded.get(table, 0) + len(batch)
+            self.pending_rows += len(batch)
+            if self.pending_rows >= SqlLoader.TRANSACTION_ROWS:
+                self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_rows = 0
+
+    def repo_id(self, name, sample):
+        # A repo loaded before keeps its id, but loses the rows of the earlier load
+        self.cursor.execute("SELECT repo_id FROM repos WHERE name = " + self.placeholder, [name])
+        found = self.cursor.fetchone()
+        if found == None:
+            self.cursor.execute("INSERT INTO repos (name, sample) VALUES (" + self.placeholder + ","
+                                + self.placeholder + ")", [name, sample])
+            return self.cursor.lastrowid
+        repo_id = found[0]
+        self.cursor.execute("UPDATE repos SET sample = " + self.placeholder + " WHERE repo_id = "
+                            + self.placeholder, [sample, repo_id])
+        for table in ["commits", "todos", "repo_summaries", "monthly_rollups"]:
+            self.cursor.execute("DELETE FROM " + table + " WHERE repo_id = " + self.placeholder, [repo_id])
+        return repo_id
+
+    def sql_datetime(epoch):
+        return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime(SqlLoader.SQL_DATETIME_FORMAT)
+
+    def todo_datetime(value):
+        if value == "N/A" or value == "":
+            return None
+        return SqlLoader.sql_datetime(CommitInfo.epoch_from_human_readable(value))
+
+    def sloc_datetime(value):
+        # Dates are stored in UTC, as DATETIME has no time zone
+        parsed = datetime.datetime.strptime(value.strip(), SqlLoader.SLOC_DATE_FORMAT)
+        return parsed.astimezone(datetime.timezone.utc).strftime(SqlLoader.SQL_DATETIME_FORMAT)
+
+    def iter_todo_rows(repo_id, f):
+        reader = csv.reader(f)
+        header = next(reader)
+        at = {name: i for i, name in enumerate(header)}
+        for row in reader:
+            yield [repo_id, int(row[at[RepoDataHeader.TODO_ID]]),
+                   SqlLoader.todo_datetime(row[at[RepoDataHeader.ADDED]]),
+                   SqlLoader.todo_datetime(row[at[RepoDataHeader.DELETED]]),
+                   float(row[at[RepoDataHeader.AGE]]), int(row[at[RepoDataHeader.FILETOUCHES]]),
+                   int(row[at[RepoDataHeader.AUTHOR_UNION]]), int(row[at[RepoDataHeader.AUTHOR_INTERSECT]]),
+                   row[at[RepoDataHeader.TODO]], row[at[RepoDataHeader.CONTEXTS]], row[at[RepoDataHeader.FILEPATHS]]]
+
+    def iter_commit_rows(repo_id, f):
+        # bba.sh rows are the commit, date and parents, then the line counts of the whole tree;
+        # the Path column is left out. Older bba.sh output has a space after some commas.
+        reader = csv.reader(f, skipinitialspace = True)
+        next(reader)
+        for row in reader:
+            if len(row) < 14:
+                continue # A commit sloc failed on
+            yield ([repo_id, row[0], SqlLoader.sloc_datetime(row[1]), row[2] or None, row[3] or None]
+                   + [int(count) for count in row[5:14]])
+
+    def iter_rolled_up(rows, rollups):
+        # Passes commit rows through, adding each to the sums of its month. Densities are lines
+        # per thousand, and only taken over commits with lines to divide by, as SQL's AVG skips
+        # the NULL of a division by zero.
+        for row in rows:
+            physical, source, comment, regex = row[5], row[6], row[7], row[13]
+            month = rollups.setdefault((int(row[2][:4]), int(row[2][5:7])), [0, 0, 0.0, 0.0, 0.0, 0, 0.0])
+            month[0] += 1
+            if physical > 0:
+                density = regex * 1000.0 / physical
+                month[1] += 1
+                month[2] += density
+                month[3] += density * density
+                month[4] += comment * 1000.0 / physical
+            if source > 0:
+                month[5] += 1
+                month[6] += regex * 1000.0 / source
+            yield row
+
+    def summary_row(repo_id, f):
+        # Summaries written before a column was added leave it NULL
+        header, values = list(csv.reader(f))[:2]
+        columns = ["repo_id"]
+        row = [repo_id]
+        for name, value in zip(header, values):
+            if name in SqlLoader.SUMMARY_COLUMNS:
+                columns.append(SqlLoader.SUMMARY_COLUMNS[name])
+                row.append(value if value != "" else None)
+        return columns, row
+
+    def load_repo(self, name, sample, todos_file, summary_file, sloc_file):
+        # Returns the files that weren't there to load
+        repo_id = self.repo_id(name, sample)
+        missing = []
+        if os.path.isfile(todos_file):
+            with open(todos_file, newline = "") as f:
+                self.insert_rows("todos", SqlLoader.TODO_COLUMNS, SqlLoader.iter_todo_rows(repo_id, f))
+        else:
+            missing.append(todos_file)
+        if os.path.isfile(summary_file):
+            with open(summary_file, newline = "") as f:
+                columns, row = SqlLoader.summary_row(repo_id, f)
+            self.insert_rows("repo_summaries", columns, [row])
+        else:
+            missing.append(summary_file)
+        if os.path.isfile(sloc_file):
+            rollups = {} # Map from (year, month) to the sums of that month
+            with open(sloc_file, newline = "") as f:
+                self.insert_rows("commits", SqlLoader.COMMIT_COLUMNS,
+                                 SqlLoader.iter_rolled_up(SqlLoader.iter_commit_rows(repo_id, f), rollups))
+            # Only the repo loaded has its rollups rebuilt, from the rows just read
+            self.insert_rows("monthly_rollups", SqlLoader.ROLLUP_COLUMNS,
+                             [[repo_id, sample, year, month] + sums for (year, month), sums in sorted(rollups.items())])
+        else:
+            missing.append(sloc_file)
+        return missing
+
+    def load_corpus(self, sample_list_filename, base_dir = ".", run_handle = "run", sloc_dir = None):
+        # Every repo of the sample list in one pass. Todos and summaries are found the way
+        # todo_tab.py names them, and bba.sh output as <repo>.txt next to the repo's clone.
+        sample_map = RepoDatumFileIO.get_sample_map(sample_list_filename)
+        ta = TodoArgs(list(sample_map.keys()) + ["--baseDir", base_dir, "--runHandle", run_handle])
+        sloc_dir = (base_dir if sloc_dir == None else sloc_dir)
+        missing = []
+        for name, sample in sample_map.items():
+            missing.extend(self.load_repo(name, sample, ta.data_file_name(name, "_todos.csv"),
+                                          ta.data_file_name(name, "_summary.csv"),
+                                          os.path.join(sloc_dir, name + ".txt")))
+        self.commit()
+        return missing
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Load the outputs of a mining run into the sql/schema.sql tables.')
+    parser.add_argument('sample_list', help='the ; separated list of repos and their samples, as repos.txt')
+    parser.add_argument('--baseDir', dest='base_dir', default=".",
+                        help='directory todo_tab.py wrote its outputs to (default: . )')
+    parser.add_argument('--runHandle', dest='run_handle', default="run",
+                        help='run handle todo_tab.py was given (default: run)')
+    parser.add_argument('--slocDir', dest='sloc_dir', default=None,
+                        help='directory holding the <repo>.txt outputs of bba.sh (default: the base directory)')
+    parser.add_argument('--sqlite', dest='sqlite', default=None,
+                        help='load into this SQLite database file instead of MySQL')
+    parser.add_argument('--mysqlHost', dest='mysql_host', default="localhost",
+                        help='MySQL server to load into (default: localhost)')
+    parser.add_argument('--mysqlUser', dest='mysql_user', default="root",
+                        help='MySQL user (default: root)')
+    parser.add_argument('--mysqlPassword', dest='mysql_password', default="",
+                        help='MySQL password (default: none)')
+    parser.add_argument('--mysqlDatabase', dest='mysql_database', default="sloc_analyzer",
+                        help='MySQL database (default: sloc_analyzer)')
+    args = parser.parse_args()
+
+    if args.sqlite != None:
+        loader = SqlLoader.sqlite(args.sqlite)
+    else:
+        loader = SqlLoader.mysql(args.mysql_host, args.mysql_user, args.mysql_password, args.mysql_database)
+    missing = loader.load_corpus(args.sample_list, args.base_dir, args.run_handle, args.sloc_dir)
+    for filename in missing:
+        print("Missing " + filename)
+    for table, count in sorted(loader.loaded.items()):
+        print(table + ": " + str(count) + " rows")
@@ -0,0 +1,81 @@
+import unittest
+from sqlload import SqlLoader
+from sloc import SlocHistory
+from todo_tests import make_git_repo, SAMPLE_HISTORY
+from todos import TodoArgs
+import todo_tab
+from git import Repo
+import os, tempfile
+
+class SqlLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        remote = os.path.join(self.tmp.name, "remote")
+        self.base_dir = os.path.join(self.tmp.name, "base")
+        make_git_repo(os.path.join(remote, "me", "one"), SAMPLE_HISTORY * 2)
+        make_git_repo(os.path.join(remote, "me", "two"), SAMPLE_HISTORY[:2])
+        os.makedirs(self.base_dir)
+        todo_tab.mine_repos(TodoArgs(["me/one", "me/two", "--baseDir", self.base_dir, "--cloneFrom", remote]))
+        # bba.sh output is only there for me/one
+        with open(os.path.join(self.base_dir, "me", "one.txt"), "w") as f:
+            SlocHistory(Repo(os.path.join(self.base_dir, "me", "one"))).write_csv(f)
+        self.sample_list = os.path.join(self.tmp.name, "repos.txt")
+        with open(self.sample_list, "w") as f:
+            f.write("repo;Sample\nme/one;Top10\nme/two;Scientific\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_corpus(self):
+        database = os.path.join(self.tmp.name, "sloc.db")
+        batch_rows = SqlLoader.BATCH_ROWS
+        SqlLoader.BATCH_ROWS = 3 # So the commits span full and partial batches
+        try:
+            loader = SqlLoader.sqlite(database)
+            missing = loader.load_corpus(self.sample_list, self.base_dir)
+            # Loading again replaces the rows of the first load
+            reloaded = SqlLoader.sqlite(database)
+            reloaded.load_corpus(self.sample_list, self.base_dir)
+        finally:
+            SqlLoader.BATCH_ROWS = batch_rows
+        self.assertEqual(missing, [os.path.join(self.base_dir, "me", "two.txt")])
+        self.assertEqual(loader.loaded["commits"], 8)
+        self.assertEqual(loader.loaded, reloaded.loaded)
+        cursor = reloaded.connection.cursor()
+        cursor.execute("SELECT R.name, R.sample, COUNT(C.commit_id) FROM repos R LEFT JOIN commits C ON R.repo_id = C.repo_id "
+                       "GROUP BY R.repo_id ORDER BY R.name")
+        self.assertEqual(cursor.fetchall(), [("me/one", "Top10", 8), ("me/two", "Scientific", 0)])
+        cursor.execute("SELECT commit_date, parent_commit_2, todo_lines FROM commits ORDER BY commit_date LIMIT 1")
+        self.assertEqual(cursor.fetchone(), ("2016-11-24 15:06:40", None, 1))
+        cursor.execute("SELECT R.name, S.total_commits, S.bus_factor, COUNT(T.todo_id) FROM repos R "
+                       "JOIN repo_summaries S ON R.repo_id = S.repo_id JOIN todos T ON R.repo_id = T.repo_id "
+                       "GROUP BY R.repo_id ORDER BY R.name")
+        self.assertEqual(cursor.fetchall(), [("me/one", 8, 1, 3), ("me/two", 2, 1, 2)])
+        cursor.execute("SELECT R.name, T.body FROM todos T JOIN repos R ON R.repo_id = T.repo_id "
+                       "WHERE T.deleted IS NULL ORDER BY R.name, T.body")
+        self.assertEqual(cursor.fetchall(), [("me/two", "# TODO make this configurable"), ("me/two", "// FIXME leaks memory")])
+
+    def test_monthly_rollups(self):
+        loader = SqlLoader.sqlite(os.path.join(self.tmp.name, "sloc.db"))
+        loader.load_corpus(self.sample_list, self.base_dir)
+        cursor = loader.connection.cursor()
+        cursor.execute("SELECT * FROM monthly_rollups ORDER BY repo_id, commit_year, commit_month")
+        rollups = cursor.fetchall()
+        # The same sums straight off the commits
+        cursor.execute("SELECT C.repo_id, R.sample, CAST(strftime('%Y', C.commit_date) AS INT) AS y, "
+                       "CAST(strftime('%m', C.commit_date) AS INT) AS m, COUNT(*), COUNT(NULLIF(C.physical_lines, 0)), "
+                       "TOTAL(C.regex_lines * 1000.0 / NULLIF(C.physical_lines, 0)), "
+                       "TOTAL((C.regex_lines * 1000.0 / NULLIF(C.physical_lines, 0)) * (C.regex_lines * 1000.0 / NULLIF(C.physical_lines, 0))), "
+                       "TOTAL(C.comment_lines * 1000.0 / NULLIF(C.physical_lines, 0)), COUNT(NULLIF(C.source_lines, 0)), "
+                       "TOTAL(C.regex_lines * 1000.0 / NULLIF(C.source_lines, 0)) "
+                       "FROM commits C JOIN repos R ON R.repo_id = C.repo_id GROUP BY C.repo_id, y, m ORDER BY C.repo_id, y, m")
+        expected = cursor.fetchall()
+        self.assertEqual([row[:6] for row in rollups], [row[:6] for row in expected])
+        self.assertEqual([(2016, 11, 7), (2016, 12, 1)], [row[2:5] for row in rollups])
+        for rollup, row in zip(rollups, expected):
+            for value, expected_value in zip(rollup[6:], row[6:]):
+                self.assertAlmostEqual(value, expected_value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
+from contextlib import contextmanager
 import time
+import json, csv
 
 class Stopwatch:
 
     def __init__(self):
         self.counts = {}
         self.times = {}
+        self.counters = {} # Map from counter name to its running total, eg. bytes read
+        self.active = [] # Names of the timers currently running, outermost first
         self.reset()
     
     def reset(self):
@@ -18,6 +22,58 @@ class Stopwatch:
         if verbose>0 and self.counts[task]%verbose == 0:
             print(task + " (iter. "+str(self.counts[task])+") took " + str(elapsed) + " seconds.")
     
+    @contextmanager
+    def timer(self, task):
+        # Times the block as a task of its own, named under any timers it runs within, as
+        # "walk/parse diff". Laps aren't affected.
+        self.active.append(task)
+        name = "/".join(self.active)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.active.pop()
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.times[name] = self.times.get(name, 0) + elapsed
+    
+    def count(self, counter, amount = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+    
+    def merge(self, other, prefix = ""):
+        # Fold another stopwatch's laps into this one, eg. one returned by a worker process,
+        # optionally naming its tasks under prefix. Counters are summed under their own names, as
+        # work counts the same whichever process did it, where worker time overlaps the caller's.
+        for task, count in other.counts.items():
+            self.counts[prefix + task] = self.counts.get(prefix + task, 0) + count
+            self.times[prefix + task] = self.times.get(prefix + task, 0) + other.times[task]
+        for counter, value in other.counters.items():
+            self.count(counter, value)
+        return self
+    
+    def as_dict(self, rate_task = None):
+        # Counters are also given per second of rate_task, when it was timed
+        output = {"tasks": {task: {"count": count, "seconds": self.times[task]}
+                            for task, count in self.counts.items()},
+                  "counters": dict(self.counters)}
+        if self.times.get(rate_task, 0) > 0:
+            output["rates"] = {counter + "/sec": value / self.times[rate_task]
+                               for counter, value in self.counters.items()}
+        return output
+    
+    def write_json(self, f, rate_task = None):
+        json.dump(self.as_dict(rate_task), f, indent = 1, sort_keys = True)
+    
+    def write_csv(self, f, rate_task = None):
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(["kind", "name", "count", "seconds", "value"])
+        stats = self.as_dict(rate_task)
+        for task, lap in stats["tasks"].items():
+            writer.writerow(["task", task, lap["count"], lap["seconds"], ""])
+        for kind in ["counters", "rates"]:
+            for name, value in stats.get(kind, {}).items():
+                writer.writerow([kind[:-1], name, "", "", value])
+    
     def __str__(self):
         out = ""
         for task, count in self.counts.items():
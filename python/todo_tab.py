@@ -1,57 +1,373 @@
 from stopwatch import Stopwatch
 from todos import RepoCommitReader, TODO, TodoArgs
-import csv, os
+from rds import RepoDataHeader
+from sloc import SlocCounter, SlocHistory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+import asyncio, multiprocessing
+import csv, json, os, signal, time
 import argparse
+import traceback
+import pandas as pd
 
-ta = TodoArgs()
-sw = Stopwatch()
+WRITE_BUFFER = 1 << 20 # Bytes buffered per output file
+PARQUET_CHUNK_ROWS = 1 << 16 # Rows held in memory per parquet row group
 
-for repo_handle in ta.get_repos():
-    
+def write_parquet_table(path, header, rows, dtypes):
+    # Written a chunk of rows at a time, under a fixed schema so every repo's file reads back
+    # with the same column types
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    typed = lambda frame: frame.astype({column: dtype for column, dtype in dtypes.items() if column in frame})
+    schema = pa.Schema.from_pandas(typed(pd.DataFrame(columns = header)), preserve_index = False)
+    # An empty categorical has no value type yet, so it's pinned to strings
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(i, field.with_type(pa.dictionary(field.type.index_type, pa.string())))
+    rows = iter(rows)
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            frame = pd.DataFrame(list(islice(rows, PARQUET_CHUNK_ROWS)), columns = header)
+            for column in [RepoDataHeader.ADDED, RepoDataHeader.DELETED]:
+                if column in frame:
+                    frame[column] = frame[column].where(frame[column] != "N/A")
+            writer.write_table(pa.Table.from_pandas(typed(frame), schema = schema, preserve_index = False))
+            if len(frame) < PARQUET_CHUNK_ROWS:
+                break
+
+def todo_header():
+    header = ["repo", "todo ID"]
+    header.extend(TODO.time_measures())
+    header.extend(TODO.author_measures())
+    header.extend(TODO.plaintext_measures())
+    return header
+
+def iter_todo_rows(repo_handle, repo, repo_lookup_file):
+    # One row per TODO, produced as the writer asks for it, with the TODO's commit hashes
+    # written out alongside, so nothing is held per TODO
+    filetouches = repo.get_filetouches()
+    for count, todo_obj in enumerate(repo.get_todos_map().values()):
+
+        repo_lookup_file.write("\ntodo ID = " + str(count) + "\n")
+        todo_obj.write_description(repo_lookup_file)
+        data_row = [repo_handle, count]
+
+        data_row.extend(todo_obj.get_time_measures(repo, filetouches[count]))
+        data_row.extend(todo_obj.get_author_measures())
+        data_row.extend(todo_obj.get_plaintext_measures())
+        yield data_row
+
+def write_repo_data(ta, repo_handle, repo, sw):
+
+    with ta.open_data_file(repo_handle, "_commithashes.txt", WRITE_BUFFER) as repo_lookup_file:
+        rows = iter_todo_rows(repo_handle, repo, repo_lookup_file)
+        if ta.get_output_format() == "parquet":
+            with ta.writing_file(ta.data_file_name(repo_handle, "_todos.parquet")) as path:
+                write_parquet_table(path, todo_header(), rows, RepoDataHeader.TODO_DTYPES)
+        else:
+            with ta.open_data_file(repo_handle, "_todos.csv", WRITE_BUFFER) as repo_data_csv:
+                writer = csv.writer(repo_data_csv, lineterminator='\n')
+                writer.writerow(todo_header())
+                writer.writerows(rows)
+    sw.lap("write todo data", verbose = 1)
+
+    repo_summary = [RepoCommitReader.repo_summary_measures()]
+    repo_summary.append(repo.get_repo_summary_measures())
+
+    if ta.get_output_format() == "parquet":
+        with ta.writing_file(ta.data_file_name(repo_handle, "_summary.parquet")) as path:
+            write_parquet_table(path, repo_summary[0], repo_summary[1:], RepoCommitReader.SUMMARY_DTYPES)
+    else:
+        with ta.open_data_file(repo_handle, "_summary.csv") as repo_summary_csv:
+            writer = csv.writer(repo_summary_csv, lineterminator='\n')
+            writer.writerows(repo_summary)
+
+# The stages of mining one repo, each lapping sw. A pipelined run hands them to different
+# threads and processes, so each starts its own clock rather than counting the wait for it.
+
+def fetch_repo(ta, repo_handle, sw, reuse = False):
     sw.reset()
-    repo = RepoCommitReader.get_cloned_repo(ta.get_remote_dir(repo_handle),
-        ta.get_local_dir(repo_handle))
-    sw.lap("cloned repo", verbose = 1)
-    
-    repo.iterate_over_commits(int(ta.get_max_count()), int(ta.get_lines_after()))
-    todos_map = repo.get_todos_map()
+    remote = ta.get_remote_dir(repo_handle)
+    local = ta.get_local_dir(repo_handle)
+    if reuse or ta.reuses_clones():
+        RepoCommitReader.get_fetched_repo(remote, local, ta.get_clone_filter(),
+            ta.get_mirror_dir(repo_handle))
+        sw.lap("fetched repo", verbose = 1)
+    else:
+        RepoCommitReader.get_cloned_repo(remote, local, ta.get_clone_filter(),
+            ta.get_mirror_dir(repo_handle))
+        sw.lap("cloned repo", verbose = 1)
+
+def walk_repo(ta, repo_handle, sw):
+    sw.reset()
+    repo = RepoCommitReader.get_local_repo(ta.get_local_dir(repo_handle))
+    resume = (ta.is_incremental()
+              and repo.load_checkpoint(ta.data_file_name(repo_handle, "_checkpoint.pkl")))
+    repo.iterate_over_commits(int(ta.get_max_count()), int(ta.get_lines_after()),
+                              ta.get_walk_jobs(), ta.get_commit_source(), resume,
+                              ta.get_matcher(), ta.tracks_moves())
     sw.lap("analyze commits", verbose = 1)
-    
-    csv_data = []
-    count = 0
-    
-    with ta.open_data_file(repo_handle, "_commithashes.txt") as repo_lookup_file:
-        with ta.open_data_file(repo_handle, "_todos.csv") as repo_data_csv:
-            with ta.open_data_file(repo_handle, "_summary.csv") as repo_summary_csv:
-            
-                header = ["repo", "todo ID"]
-                header.extend(TODO.time_measures())
-                header.extend(TODO.author_measures())
-                header.extend(TODO.plaintext_measures())
-                csv_data.append(header)
-
-                for todo_handle, todo_obj in todos_map.items():
-                    
-                    repo_lookup_file.write("\ntodo ID = " + str(count) + "\n")
-                    repo_lookup_file.write(str(todo_obj))
-                    data_row = [repo_handle, count]
-                    
-                    data_row.extend(todo_obj.get_time_measures(repo))
-                    data_row.extend(todo_obj.get_author_measures())
-                    data_row.extend(todo_obj.get_plaintext_measures())
-                    
-                    csv_data.append(data_row)
-                    count = count + 1
-
-                sw.lap("write hash data", verbose = 1)
-                writer = csv.writer(repo_data_csv, lineterminator='\n')
-                writer.writerows(csv_data)
-                sw.lap("write todo data", verbose = 1)
-                
-                repo_summary = [RepoCommitReader.repo_summary_measures()]
-                repo_summary.append(repo.get_repo_summary_measures())
-                writer = csv.writer(repo_summary_csv, lineterminator='\n')
-                writer.writerows(repo_summary)
-
-print("Stopwatch lap stats:")
-print(sw)
+    sw.merge(repo.sw)
+    if ta.counts_lines():
+        write_cloc(ta, repo_handle, repo.repo, sw)
+    return repo
+
+def write_cloc(ta, repo_handle, git_repo, sw):
+    # Only the blobs no earlier run with the run handle has counted are read
+    counter = SlocCounter(matcher = ta.get_matcher())
+    cache_file = ta.data_file_name(repo_handle, "_sloc_cache.pkl")
+    counter.load_cache(cache_file)
+    with ta.open_data_file(repo_handle, "_cloc.csv") as f:
+        SlocHistory(git_repo, counter).write_cloc(f)
+    counter.save_cache(cache_file)
+    sw.count("blobs counted", counter.blobs_read)
+    sw.lap("count lines", verbose = 1)
+
+def write_walked_repo(ta, repo_handle, sw, repo):
+    sw.reset()
+    if ta.is_incremental():
+        repo.save_checkpoint(ta.data_file_name(repo_handle, "_checkpoint.pkl"))
+        sw.lap("write checkpoint", verbose = 1)
+
+    # Outputs are always rewritten from the whole (possibly resumed) state
+    write_repo_data(ta, repo_handle, repo, sw)
+    write_stopwatch(ta, repo_handle, sw)
+
+def mine_repo(ta, repo_handle, reuse = False):
+
+    sw = Stopwatch()
+    fetch_repo(ta, repo_handle, sw, reuse)
+    repo = walk_repo(ta, repo_handle, sw)
+    write_walked_repo(ta, repo_handle, sw, repo)
+    return sw
+
+def write_stopwatch(ta, repo_handle, sw):
+    # Counters are per second of the commit walk
+    if ta.get_stopwatch_format() == "json":
+        with ta.open_data_file(repo_handle, "_stopwatch.json") as f:
+            sw.write_json(f, "walk")
+    elif ta.get_stopwatch_format() == "csv":
+        with ta.open_data_file(repo_handle, "_stopwatch.csv") as f:
+            sw.write_csv(f, "walk")
+
+def mine_repo_isolated(ta, repo_handle, reuse = False):
+    # A failing repo is reported back instead of raised, so it can't take the rest of the run down
+    try:
+        return repo_handle, mine_repo(ta, repo_handle, reuse), None
+    except Exception:
+        return repo_handle, None, traceback.format_exc()
+
+def start_worker():
+    # Each worker leads a process group with the git processes it starts. A pool broken by another
+    # worker dying terminates it, and it takes them down with it rather than leave a clone writing
+    # into the base directory.
+    os.setpgrp()
+    signal.signal(signal.SIGTERM, lambda signum, frame: os.killpg(0, signal.SIGKILL))
+
+def run_alone(function, *args):
+    # Runs function in a worker process of its own, so if the process dies no other repo goes with it
+    with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("forkserver"),
+                             initializer = start_worker) as pool:
+        return pool.submit(function, *args).result()
+
+def mine_repo_alone(ta, repo_handle):
+    # Mines a repo a broken pool lost, from whatever clone it left
+    try:
+        return run_alone(mine_repo_isolated, ta, repo_handle, True)
+    except Exception:
+        return repo_handle, None, traceback.format_exc()
+
+def run_stage(stage, ta, repo_handle, sw, *args):
+    # One stage of a repo in a pipelined run. The stopwatch is handed back with the result, as a
+    # stage run in a worker process laps a copy of it, and so is any error, rather than raised.
+    try:
+        return stage(ta, repo_handle, sw, *args), sw, None
+    except Exception:
+        return None, sw, traceback.format_exc()
+
+def sample_queue(sw, name, queue):
+    # Depths are summed over the samples, so depth / samples is the mean depth seen
+    sw.count(name + " queue depth", queue.qsize())
+    sw.count(name + " queue samples")
+
+async def run_pipeline(ta, repos, record, sw):
+    # Clones up to prefetch repos at a time in threads, walks the clones in jobs worker processes
+    # and writes out each walked repo in a thread, all at once. The queues between the stages are
+    # bounded, so a stage that falls behind holds up the ones before it rather than piling up
+    # clones or walked repos.
+    loop = asyncio.get_running_loop()
+    prefetch = ta.get_prefetch()
+    jobs = ta.get_jobs()
+    cloned = asyncio.Queue(maxsize = prefetch) # Repos waiting for a walker
+    walked = asyncio.Queue(maxsize = jobs) # Repos waiting for the writer
+    fetching = asyncio.Semaphore(prefetch)
+
+    async def put(queue, name, item):
+        await queue.put(item)
+        sample_queue(sw, name, queue)
+
+    async def get(queue, name):
+        sample_queue(sw, name, queue)
+        return await queue.get()
+
+    # Worker processes are started by a server process, as forking one with threads running is unsafe
+    new_cpu_pool = lambda: ProcessPoolExecutor(max_workers = jobs, mp_context = multiprocessing.get_context("forkserver"),
+                                               initializer = start_worker)
+    cpu_pools = [new_cpu_pool()] # The last is in use, any others were broken
+    with ThreadPoolExecutor(max_workers = prefetch + 1) as io_pool:
+
+        # A stage raises past run_stage only when its pool fails, as when a worker process dies and
+        # breaks the pool. The repo is then failed like any other, so the stages after still see it.
+
+        async def fetch(repo_handle):
+            repo_sw = Stopwatch()
+            try:
+                _, repo_sw, error = await loop.run_in_executor(io_pool, run_stage, fetch_repo, ta, repo_handle, repo_sw)
+            except Exception:
+                error = traceback.format_exc()
+            await put(cloned, "cloned", (repo_handle, repo_sw, error))
+            fetching.release()
+
+        async def fetch_all():
+            fetches = []
+            for repo_handle in repos:
+                await fetching.acquire()
+                fetches.append(asyncio.create_task(fetch(repo_handle)))
+            await asyncio.gather(*fetches)
+            for _ in range(jobs):
+                await cloned.put(None)
+
+        async def walk():
+            while True:
+                item = await get(cloned, "cloned")
+                if item == None:
+                    return
+                repo_handle, repo_sw, error = item
+                repo = None
+                if error == None:
+                    cpu_pool = cpu_pools[-1]
+                    try:
+                        repo, repo_sw, error = await loop.run_in_executor(cpu_pool, run_stage, walk_repo,
+                                                                          ta, repo_handle, repo_sw)
+                    except BrokenProcessPool:
+                        # A walker died, taking the others' walks with it. Later repos get a new
+                        # pool, and this one is walked again alone, failing if it kills that too.
+                        if cpu_pool is cpu_pools[-1]:
+                            cpu_pools.append(new_cpu_pool())
+                            sw.count("walker pools broken")
+                        try:
+                            repo, repo_sw, error = await loop.run_in_executor(None, run_alone, run_stage, walk_repo,
+                                                                              ta, repo_handle, repo_sw)
+                        except Exception:
+                            error = traceback.format_exc()
+                    except Exception:
+                        error = traceback.format_exc()
+                await put(walked, "walked", (repo_handle, repo_sw, repo, error))
+
+        async def write():
+            while True:
+                item = await get(walked, "walked")
+                if item == None:
+                    return
+                repo_handle, repo_sw, repo, error = item
+                if error == None:
+                    try:
+                        _, repo_sw, error = await loop.run_in_executor(io_pool, run_stage, write_walked_repo,
+                                                                       ta, repo_handle, repo_sw, repo)
+                    except Exception:
+                        error = traceback.format_exc()
+                record(repo_handle, repo_sw, error)
+
+        try:
+            walkers = [asyncio.create_task(walk()) for _ in range(jobs)]
+            writer = asyncio.create_task(write())
+            await fetch_all()
+            await asyncio.gather(*walkers)
+            await walked.put(None)
+            await writer
+        finally:
+            for cpu_pool in cpu_pools:
+                cpu_pool.shutdown()
+    sw.lap("pipeline")
+
+def read_manifest(ta):
+    # Map from repo handle to how its latest mining under the run handle went
+    path = ta.run_file_name("_manifest.json")
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(ta, manifest):
+    with ta.writing_file(ta.run_file_name("_manifest.json")) as path:
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent = 1, sort_keys = True)
+
+def mine_repos(ta):
+
+    sw = Stopwatch()
+    failed = []
+
+    if ta.get_output_format() == "parquet":
+        import pyarrow.parquet # Fails up front rather than once per repo when pyarrow is missing
+
+    manifest = read_manifest(ta)
+    repos = ta.get_repos()
+    if ta.is_resume():
+        repos = [repo_handle for repo_handle in repos
+                 if manifest.get(repo_handle, {}).get("status") != "completed"]
+        print("Skipping " + str(len(ta.get_repos()) - len(repos)) + " repos completed in an earlier run")
+
+    # Each repo is recorded in the manifest as soon as it finishes, whatever the order
+    results = {}
+    def record(repo_handle, repo_sw, error):
+        results[repo_handle] = (repo_sw, error)
+        manifest[repo_handle] = {"status": ("completed" if error == None else "failed"), "finished": time.time()}
+        if error != None:
+            manifest[repo_handle]["error"] = error.strip().split("\n")[-1]
+        write_manifest(ta, manifest)
+
+    if ta.is_pipelined():
+        pipeline_sw = Stopwatch()
+        asyncio.run(run_pipeline(ta, repos, record, pipeline_sw))
+        sw.merge(pipeline_sw)
+    elif ta.get_jobs() > 1:
+        broken = [] # Repos a worker dying took down, whether or not they were the one that killed it
+        with ProcessPoolExecutor(max_workers = ta.get_jobs(), initializer = start_worker) as pool:
+            futures = {pool.submit(mine_repo_isolated, ta, repo_handle): repo_handle for repo_handle in repos}
+            for future in as_completed(futures):
+                try:
+                    record(*future.result())
+                except BrokenProcessPool:
+                    broken.append(futures[future])
+                except Exception:
+                    record(futures[future], None, traceback.format_exc())
+        # Each is mined again alone, and fails only if it kills its own process too
+        with ThreadPoolExecutor(max_workers = ta.get_jobs()) as retry_pool:
+            for result in retry_pool.map(lambda repo_handle: mine_repo_alone(ta, repo_handle), broken):
+                record(*result)
+    else:
+        for repo_handle in repos:
+            record(*mine_repo_isolated(ta, repo_handle))
+
+    # Merged in repos order whatever the pool size, so the merged stats are deterministic
+    for repo_handle in repos:
+        repo_sw, error = results[repo_handle]
+        if error != None:
+            print("Failed to mine " + repo_handle + ":\n" + error)
+            failed.append(repo_handle)
+        else:
+            sw.merge(repo_sw)
+    return sw, failed
+
+if __name__ == "__main__":
+
+    ta = TodoArgs()
+    sw, failed = mine_repos(ta)
+
+    if len(failed) > 0:
+        print("Failed repos: " + " ".join(failed))
+    print("Stopwatch lap stats:")
+    print(sw)
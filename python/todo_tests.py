@@ -1,6 +1,11 @@
 import unittest
-from todos import TODO, RepoCommitReader
-import io
+from todos import TODO, RepoCommitReader, TodoArgs, TodoMatcher, CommitRecord, CommitInfo, TodoIdentity, TODODiff
+import todo_tab
+from rds import RepoDataSample, RepoDataHeader
+from git import Repo
+import io, json, traceback
+from unittest import mock
+import os, subprocess, tempfile
 
 
 class TODOTests(unittest.TestCase):
@@ -53,6 +58,16 @@ class TODOTests(unittest.TestCase):
         self.assertEqual(todos_map["todo"].get_ignore_sum(), 2)
         pass
 
+    def test_matcher_tokens(self):
+        raw_diff = "a.c\n---@@ -1,2 +1,3 @@\n+ // XXX hack\n+ // todo later\n- // Hack around\n\n---"
+        paths, todo_diffs = RepoCommitReader.parse_raw_diff(raw_diff, 1, TodoMatcher(["xxx", "HACK"]))
+        self.assertEqual(paths, ["a.c"])
+        self.assertEqual([(d.diff_type, d.body, d.context) for d in todo_diffs],
+                         [("A", "// XXX hack", "// XXX hack // todo later"),
+                          ("D", "// Hack around", "// Hack around ")])
+        paths, todo_diffs = RepoCommitReader.parse_raw_diff(raw_diff, 0)
+        self.assertEqual([d.body for d in todo_diffs], ["// todo later"])
+
     # todo. time_measures, get_time_measures(repo)
     # todo. author_measures, get_author_measures(repo)
     
@@ -63,6 +78,371 @@ class TODOTests(unittest.TestCase):
         # TODO.UniqueHandle
         pass
 
+class TodoTabTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.remote = os.path.join(self.tmp.name, "remote")
+        make_git_repo(os.path.join(self.remote, "me", "one"), SAMPLE_HISTORY)
+        make_git_repo(os.path.join(self.remote, "me", "two"), SAMPLE_HISTORY[:2])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_tab(self, run_handle, *extra):
+        base_dir = os.path.join(self.tmp.name, run_handle)
+        os.makedirs(base_dir, exist_ok = True)
+        ta = TodoArgs(["me/one", "me/missing", "me/two", "--baseDir", base_dir,
+                       "--runHandle", run_handle, "--cloneFrom", self.remote] + list(extra))
+        sw, failed = todo_tab.mine_repos(ta)
+        outputs = {}
+        for name in os.listdir(base_dir):
+            if os.path.isfile(os.path.join(base_dir, name)) and not name.endswith((".pkl", "_manifest.json")):
+                with open(os.path.join(base_dir, name)) as f:
+                    outputs[name[len(run_handle):]] = f.read()
+        return sw, failed, outputs
+
+    def test_parallel_matches_serial(self):
+        serial_sw, serial_failed, serial = self.run_tab("serial")
+        parallel_sw, parallel_failed, parallel = self.run_tab("parallel", "--jobs", "3")
+        self.assertEqual(serial_failed, ["me/missing"])
+        self.assertEqual(parallel_failed, ["me/missing"])
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial), 6)
+        self.assertEqual(parallel_sw.counts["cloned repo"], 2)
+
+    def test_dead_worker_fails_only_its_repo(self):
+        serial_sw, serial_failed, serial = self.run_tab("serial")
+        # Workers take exiting_mine_repo_isolated by name, whether forked or started by a server
+        with mock.patch.object(todo_tab, "mine_repo_isolated", exiting_mine_repo_isolated):
+            sw, failed, outputs = self.run_tab("dead", "--jobs", "2")
+        self.assertEqual(failed, ["me/missing", "me/two"])
+        self.assertEqual(outputs["_me_one__todos.csv"], serial["_me_one__todos.csv"])
+        with open(os.path.join(self.tmp.name, "dead", "dead_manifest.json")) as f:
+            manifest = json.load(f)
+        self.assertEqual({handle: entry["status"] for handle, entry in manifest.items()},
+                         {"me/one": "completed", "me/missing": "failed", "me/two": "failed"})
+
+    def test_pipeline_matches_serial(self):
+        serial_sw, serial_failed, serial = self.run_tab("serial")
+        piped_sw, piped_failed, piped = self.run_tab("piped", "--pipeline", "--jobs", "2", "--prefetch", "1")
+        self.assertEqual(piped_failed, ["me/missing"])
+        self.assertEqual(serial, piped)
+        self.assertEqual(piped_sw.counts["cloned repo"], 2)
+        self.assertEqual(piped_sw.counters["commits"], serial_sw.counters["commits"])
+        # Each repo is put on and taken off each queue, and the walkers each take an end marker
+        self.assertEqual(piped_sw.counters["cloned queue samples"], 3 * 2 + 2)
+        self.assertEqual(piped_sw.counters["walked queue samples"], 3 * 2 + 1)
+        self.assertLessEqual(piped_sw.counters["cloned queue depth"], piped_sw.counters["cloned queue samples"])
+
+    def test_dead_walker_fails_its_repos(self):
+        # Walkers are started by a server process, so they take exiting_walk_repo by name
+        with mock.patch.object(todo_tab, "walk_repo", exiting_walk_repo):
+            sw, failed, outputs = self.run_tab("deadwalk", "--pipeline", "--jobs", "2", "--prefetch", "1")
+        self.assertEqual(failed, ["me/missing", "me/two"])
+        self.assertEqual(sw.counters["walker pools broken"], 1)
+        with open(os.path.join(self.tmp.name, "deadwalk", "deadwalk_manifest.json")) as f:
+            manifest = json.load(f)
+        self.assertEqual(sorted(manifest), ["me/missing", "me/one", "me/two"])
+        self.assertEqual({handle: entry["status"] for handle, entry in manifest.items()},
+                         {"me/one": "completed", "me/missing": "failed", "me/two": "failed"})
+
+    def test_incremental_matches_full(self):
+        self.run_tab("inc", "--incremental")
+        add_git_commits(os.path.join(self.remote, "me", "one"), SAMPLE_HISTORY[:3], start = 4)
+        inc_sw, inc_failed, inc = self.run_tab("inc", "--incremental")
+        full_sw, full_failed, full = self.run_tab("full")
+        self.assertEqual(inc_sw.counts["fetched repo"], 2)
+        self.assertEqual(inc["_me_one__summary.csv"], full["_me_one__summary.csv"])
+        # Resumed TODOs keep their IDs and new ones are appended, so compare rows without IDs
+        without_ids = lambda csv_text: sorted(row.split(",", 2)[2] for row in csv_text.split("\n") if row)
+        self.assertEqual(without_ids(inc["_me_one__todos.csv"]), without_ids(full["_me_one__todos.csv"]))
+        self.assertNotEqual(inc["_me_one__todos.csv"], full["_me_one__todos.csv"])
+
+    def test_resume_skips_completed_repos(self):
+        first_sw, first_failed, first = self.run_tab("resumed")
+        with open(os.path.join(self.tmp.name, "resumed", "resumed_manifest.json")) as f:
+            manifest = json.load(f)
+        self.assertEqual({handle: entry["status"] for handle, entry in manifest.items()},
+                         {"me/one": "completed", "me/missing": "failed", "me/two": "completed"})
+        make_git_repo(os.path.join(self.remote, "me", "missing"), SAMPLE_HISTORY[:1])
+        # Completed repos are not cloned again, which would fail on their existing clones
+        resumed_sw, resumed_failed, resumed = self.run_tab("resumed", "--resume")
+        self.assertEqual(resumed_failed, [])
+        self.assertEqual(resumed_sw.counts["fetched repo"], 1)
+        for name, text in first.items():
+            self.assertEqual(resumed[name], text)
+        self.assertIn("_me_missing__todos.csv", resumed)
+        self.assertFalse([name for name in os.listdir(os.path.join(self.tmp.name, "resumed")) if name.endswith(".tmp")])
+
+    def test_cloc_files(self):
+        first_sw, first_failed, first = self.run_tab("cloc", "--cloc")
+        self.assertEqual(first["_me_one__cloc.csv"].splitlines()[1:], ["files,language,blank,comment,code", "1,C,0,1,1", "1,Python,0,0,1"])
+        self.assertGreater(first_sw.counters["blobs counted"], 0)
+        # RepoDataSample reads what todo_tab.py wrote, line counts and all
+        sample_list = os.path.join(self.tmp.name, "repos.txt")
+        with open(sample_list, "w") as f:
+            f.write("repo;Sample\nme/one;Top10\nme/two;Scientific\n")
+        rds = RepoDataSample(sample_list, os.path.join(self.tmp.name, "cloc"))
+        locs = rds.combined_data.groupby(RepoDataHeader.REPO, observed = True)[RepoDataHeader.LOC].first()
+        self.assertEqual(locs.to_dict(), {"me/one": 2, "me/two": 3})
+        # A later run only counts the blobs the first didn't, here the new b.c of me/one
+        add_git_commits(os.path.join(self.remote, "me", "one"), SAMPLE_HISTORY[:3], start = 4)
+        second_sw, second_failed, second = self.run_tab("cloc", "--cloc", "--incremental")
+        self.assertEqual(second_sw.counters["blobs counted"], 1)
+        self.assertEqual(second["_me_one__cloc.csv"].splitlines()[2:], ["2,C,0,3,3", "1,Python,0,0,1"])
+
+    def test_resume_after_crash(self):
+        first_sw, first_failed, first = self.run_tab("crashed")
+        # As if the run died mining me/two, after cloning it, and while cloning me/missing
+        manifest_file = os.path.join(self.tmp.name, "crashed", "crashed_manifest.json")
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        del manifest["me/two"], manifest["me/missing"]
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f)
+        os.remove(os.path.join(self.tmp.name, "crashed", "crashed_me_two__todos.csv"))
+        subprocess.run(["git", "init", "-q", os.path.join(self.tmp.name, "crashed", "me", "missing")], check = True)
+        make_git_repo(os.path.join(self.remote, "me", "missing"), SAMPLE_HISTORY[:1])
+        resumed_sw, resumed_failed, resumed = self.run_tab("crashed", "--resume")
+        self.assertEqual(resumed_failed, [])
+        self.assertEqual(resumed_sw.counts["fetched repo"], 2)
+        for name, text in first.items():
+            self.assertEqual(resumed[name], text)
+        self.assertIn("_me_missing__todos.csv", resumed)
+
+    def test_reuse_keeps_other_directories(self):
+        # A directory where a clone would go that was never one is left alone, failing its repo
+        notes = os.path.join(self.tmp.name, "kept", "me", "one", "notes")
+        os.makedirs(notes)
+        sw, failed, outputs = self.run_tab("kept", "--reuseClones")
+        self.assertEqual(failed, ["me/one", "me/missing"])
+        self.assertEqual(os.listdir(os.path.dirname(notes)), ["notes"])
+
+    def test_interrupted_write_leaves_no_file(self):
+        ta = TodoArgs(["me/one", "--baseDir", self.tmp.name])
+        with self.assertRaises(KeyboardInterrupt):
+            with ta.open_data_file("me/one", "_todos.csv") as f:
+                f.write("partial")
+                raise KeyboardInterrupt()
+        self.assertEqual(os.listdir(self.tmp.name), ["remote"])
+
+    def test_stopwatch_output(self):
+        plain_sw, plain_failed, plain = self.run_tab("plain")
+        timed_sw, timed_failed, timed = self.run_tab("timed", "--stopwatchFormat", "json", "--walkJobs", "2")
+        stats = json.loads(timed.pop("_me_one__stopwatch.json"))
+        timed.pop("_me_two__stopwatch.json")
+        self.assertEqual(plain, timed)
+        self.assertEqual(stats["counters"]["commits"], len(SAMPLE_HISTORY))
+        self.assertEqual(stats["tasks"]["workers/diff"]["count"], len(SAMPLE_HISTORY))
+        self.assertIn("commits/sec", stats["rates"])
+        self.assertEqual(timed_sw.counters["commits"], len(SAMPLE_HISTORY) + 2)
+        # Workers parse the same diffs the serial walk does
+        self.assertEqual(timed_sw.counters, plain_sw.counters)
+
+    def test_clone_modes_match_full_clone(self):
+        # Partial clones only work over the file:// transport, from a remote allowing filters
+        bare_remote = os.path.join(self.tmp.name, "bare")
+        for handle in ["me/one", "me/two"]:
+            bare = Repo.clone_from(os.path.join(self.remote, handle), os.path.join(bare_remote, handle), bare = True)
+            bare.git.config("uploadpack.allowFilter", "true")
+        self.remote = "file://" + bare_remote
+        mirror_dir = os.path.join(self.tmp.name, "mirrors")
+        full_sw, full_failed, full = self.run_tab("full")
+        blobless_sw, blobless_failed, blobless = self.run_tab("blobless", "--cloneFilter", "blob:none",
+                                                              "--mirrorDir", mirror_dir)
+        reused_sw, reused_failed, reused = self.run_tab("blobless", "--reuseClones", "--mirrorDir", mirror_dir)
+        self.assertEqual(full, blobless)
+        self.assertEqual(full, reused)
+        self.assertEqual(reused_sw.counts["fetched repo"], 2)
+        self.assertTrue(Repo(os.path.join(self.tmp.name, "blobless", "me", "one")).git.config("remote.origin.promisor"))
+        self.assertTrue(os.path.isdir(os.path.join(mirror_dir, "me", "one.git")))
+
+class RepoCommitReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = make_git_repo(os.path.join(self.tmp.name, "repo"), SAMPLE_HISTORY * 3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def walk_state(self, rcr):
+        todos = [(body, [rcr.commits.shas[i] for i in todo.added], [rcr.commits.shas[i] for i in todo.deleted],
+                  todo.filepaths, todo.contexts) for body, todo in rcr.get_todos_map().items()]
+        return (todos, rcr.paths.names, rcr.paths.touches, rcr.paths.index, rcr.author_map, rcr.commit_count,
+                rcr.oldest_commit, rcr.newest_commit)
+
+    def test_sharded_walk_matches_serial(self):
+        serial = RepoCommitReader.get_local_repo(self.path)
+        serial.iterate_over_commits(lines_after = 1)
+        sharded = RepoCommitReader.get_local_repo(self.path)
+        sharded.iterate_over_commits(lines_after = 1, jobs = 2)
+        self.assertEqual(self.walk_state(serial), self.walk_state(sharded))
+        self.assertEqual(serial.commit_count, 12)
+
+    def test_git_log_source_matches_gitpython(self):
+        for lines_after in (0, 2):
+            gitpython = RepoCommitReader.get_local_repo(self.path)
+            gitpython.iterate_over_commits(lines_after = lines_after)
+            gitlog = RepoCommitReader.get_local_repo(self.path)
+            gitlog.iterate_over_commits(lines_after = lines_after, source = "gitlog")
+            self.assertEqual(self.walk_state(gitpython), self.walk_state(gitlog))
+            # Both time parsing each changed file alike
+            self.assertEqual(gitlog.sw.counts["walk/parse diff"], gitpython.sw.counts["walk/parse diff"])
+
+    def test_track_moves(self):
+        path = make_git_repo(os.path.join(self.tmp.name, "moves"), MOVED_HISTORY)
+        plain = RepoCommitReader.get_local_repo(path)
+        plain.iterate_over_commits(lines_after = 0)
+        tracked = RepoCommitReader.get_local_repo(path)
+        tracked.iterate_over_commits(lines_after = 0, track_moves = True)
+        self.assertEqual(len(plain.get_todos_map()), 4)
+        # Moved to b.py with its punctuation changed, then reworded, and kept under the newest body
+        todos = tracked.get_todos_map()
+        self.assertEqual(sorted(todos), ["   # TODO handle unicode filenames in here", " # TODO drop python 2"])
+        moved = todos["   # TODO handle unicode filenames in here"]
+        self.assertEqual((len(moved.added), len(moved.deleted)), (1, 0))
+        self.assertEqual(moved.get_plaintext_measures()[2], "a.py;b.py")
+        self.assertEqual(len(todos[" # TODO drop python 2"].deleted), 1)
+        self.assertEqual(tracked.sw.counters["todos moved"], 2)
+        self.assertIs(tracked.get_todo(" # TODO handle unicode file names here"), moved)
+
+    def test_identity_pairs_in_bulk(self):
+        bodies = ["# TODO check bound " + str(i) + " of table " + "abcdefghij"[i % 10] * (i % 7 + 1)
+                  for i in range(300)]
+        todo_diffs = ([TODODiff("D", body, body, "old.py") for body in bodies]
+                      + [TODODiff("A", body.replace("check", "Check").replace("table", "the table"), body + ".", "new.py")
+                         for body in reversed(bodies)]
+                      + [TODODiff("A", "# FIXME unrelated", "# FIXME unrelated", "new.py")])
+        pairs = TodoIdentity().pair_moves(todo_diffs)
+        self.assertEqual(len(pairs), 300)
+        self.assertEqual({(deleted, added) for deleted, added in pairs}, {(i, 599 - i) for i in range(300)})
+
+    def test_renames_followed(self):
+        path = make_git_repo(os.path.join(self.tmp.name, "renames"), RENAMED_HISTORY)
+        states = []
+        for options in [{}, {"jobs": 2}, {"source": "gitlog"}]:
+            rcr = RepoCommitReader.get_local_repo(path)
+            rcr.iterate_over_commits(lines_after = 0, **options)
+            states.append(self.walk_state(rcr))
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(states[0], states[2])
+        # a.py became b.py, then c.py, which every commit touched under one name or another
+        self.assertEqual(rcr.paths.names, ["c.py"])
+        self.assertEqual(rcr.get_filetouches(), [5, 5])
+        self.assertEqual([todo.get_plaintext_measures()[2] for todo in rcr.get_todos_map().values()], ["c.py", "c.py"])
+        self.assertEqual(rcr.sw.counters["renames followed"], 2)
+
+    def test_commit_metadata_read_once(self):
+        rcr = RepoCommitReader(None)
+        rcr.reset_counts()
+        commit = CountingCommit("a" * 40, 1480000000, "ann@example.com")
+        for _ in range(3):
+            rcr.update_commit_agg_stats(commit)
+        todo = TODO("# TODO x", rcr.commits)
+        todo.added_in_commit(rcr.commits.index[commit.hexsha])
+        self.assertEqual(todo.get_time_measures(rcr)[:3], ["Thu, 24 Nov 2016 15:06", "N/A", 0.0])
+        self.assertEqual(rcr.author_map, {"ann@example.com": 3})
+        self.assertEqual(commit.author_reads, 1)
+        self.assertEqual(CommitInfo.human_readable_from_epoch.cache_info().maxsize, CommitInfo.CACHED_TIMES)
+
+    def test_summary_measures(self):
+        rcr = RepoCommitReader(None)
+        rcr.reset_counts()
+        rcr.commit_count = 20
+        rcr.oldest_commit, rcr.newest_commit = 0, 86400
+        rcr.author_map = {"a": 8, "b": 1, "c": 4, "d": 2, "e": 2, "f": 1, "g": 1, "h": 1}
+        summary = rcr.get_repo_summary_measures()
+        self.assertEqual(summary, rcr.get_repo_summary_measures())
+        measures = dict(zip(RepoCommitReader.repo_summary_measures(), summary))
+        # Two authors per quarter after the top one, and the last quarter takes the rest
+        self.assertEqual([measures[name] for name in RepoCommitReader.repo_summary_measures()[4:9]],
+                         [8, 6, 3, 2, 1])
+        self.assertEqual(measures["Bus Factor"], 2)
+        self.assertAlmostEqual(measures["Author Gini"], 0.425)
+        self.assertEqual(RepoCommitReader.author_gini([3, 3, 3]), 0)
+
+SAMPLE_HISTORY = [
+    {"a.py": "x = 1\n    # TODO make this configurable\n"},
+    {"a.py": "x = 2\n    # TODO make this configurable\n",
+     "b.c": "int y;\n    // FIXME leaks memory\nint z;\n"},
+    {"a.py": "x = 2\n", "b.c": "int y;\n    // FIXME leaks memory\nint z;\n    // todo free it\n"},
+    {"b.c": None, "c.c": "int y;\n    // FIXME leaks memory\n"},
+]
+
+MOVED_HISTORY = [
+    {"a.py": "x = 1\n"},
+    {"a.py": "x = 1\n  # TODO handle unicode file names here\n  # TODO drop python 2\n"},
+    {"a.py": "x = 1\n  # TODO drop python 2\n", "b.py": "y = 2\n    # todo: handle unicode file names here!\n"},
+    {"a.py": "x = 1\n", "b.py": "y = 2\n    # TODO handle unicode filenames in here\n"},
+]
+
+RENAMED_HISTORY = [
+    {"a.py": "x = 0\n"},
+    {"a.py": "x = 1\ny = 2\nz = 3\nw = 4\n  # TODO keep the name\n"},
+    {"a.py": None, "b.py": "x = 1\ny = 2\nz = 3\nw = 4\n  # TODO keep the name\n"},
+    {"b.py": None, "c.py": "x = 1\ny = 2\nz = 3\nw = 4\n  # TODO keep the name\n  # TODO and this one\n"},
+    {"c.py": "x = 5\ny = 2\nz = 3\nw = 4\n  # TODO keep the name\n  # TODO and this one\n"},
+]
+
+def exiting_mine_repo_isolated(ta, repo_handle, reuse = False):
+    # Kills the worker process mining me/two, breaking its pool
+    if repo_handle == "me/two":
+        os._exit(1)
+    try:
+        return repo_handle, todo_tab.mine_repo(ta, repo_handle, reuse), None
+    except Exception:
+        return repo_handle, None, traceback.format_exc()
+
+def exiting_walk_repo(ta, repo_handle, sw):
+    # Kills the worker process walking me/two, breaking its pool
+    if repo_handle == "me/two":
+        os._exit(1)
+    return todo_tab.walk_repo(ta, repo_handle, sw)
+
+def make_git_repo(path, history, authors = ("ann@example.com", "bob@example.com")):
+    # Builds a real repository with one commit per history entry, mapping file names to
+    # contents (None deletes the file), with fixed dates so runs are reproducible
+    os.makedirs(path)
+    subprocess.run(["git", "init", "-q"], cwd = path, check = True)
+    return add_git_commits(path, history, authors)
+
+def add_git_commits(path, history, authors = ("ann@example.com", "bob@example.com"), start = 0):
+    git = lambda *args, **env: subprocess.run(["git"] + list(args), cwd = path, check = True,
+                                               stdout = subprocess.DEVNULL,
+                                               env = dict(os.environ, **env))
+    for index, files in enumerate(history, start):
+        for name, content in files.items():
+            if content == None:
+                git("rm", "-q", name)
+            else:
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(content)
+                git("add", name)
+        author = authors[index % len(authors)]
+        date = str(1480000000 + index * 86400) + " +0000"
+        git("commit", "-q", "-m", "commit " + str(index),
+            GIT_AUTHOR_NAME = author, GIT_AUTHOR_EMAIL = author, GIT_AUTHOR_DATE = date,
+            GIT_COMMITTER_NAME = author, GIT_COMMITTER_EMAIL = author, GIT_COMMITTER_DATE = date)
+    return path
+
+class CountingCommit(CommitRecord):
+    # Counts how often its author is looked up
+
+    def __init__(self, *args):
+        self.author_reads = 0
+        CommitRecord.__init__(self, *args)
+
+    def get_author(self):
+        self.author_reads += 1
+        return self._author
+
+    def set_author(self, author):
+        self._author = author
+
+    author = property(get_author, set_author)
+
 class FakeAuthor:
     
     def __init__(self):
@@ -1,13 +1,27 @@
-from git import Repo, Commit, NULL_TREE
-import time, datetime
+from git import Repo, Commit, Actor, NULL_TREE, InvalidGitRepositoryError
+import time, datetime, calendar
 import re
 import math
-import argparse, os
+import argparse, os, shutil
+import codecs
+import io
+import pickle
+import ast
+import random
+import zlib
+import numpy as np
+from array import array
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, islice
+from collections import deque
+from functools import lru_cache
+from contextlib import contextmanager
+from stopwatch import Stopwatch
 
 class TodoArgs:
 
-    def __init__(self):
+    def __init__(self, argv = None):
         parser = argparse.ArgumentParser(description='Run commit analysis on a set of repositories.')
         parser.add_argument('repos', metavar='Repo', type=str, nargs='+',
                             help='the names of repositories to include')
@@ -22,10 +36,72 @@ class TodoArgs:
         parser.add_argument('--cloneFrom', dest='clone_from', default="https://github.com/",
                             help='clone repos from here ' + 
                             '(default: https://github.com/)')
-        self.args = parser.parse_args()
+        parser.add_argument('--jobs', dest='jobs', default=1,
+                            help='number of repositories to mine in parallel worker processes (default: 1)')
+        parser.add_argument('--pipeline', dest='pipeline', action='store_true',
+                            help='overlap cloning, walking and writing: repos are cloned ahead by threads, ' +
+                            'walked by --jobs worker processes and written out as they are walked')
+        parser.add_argument('--prefetch', dest='prefetch', default=2,
+                            help='number of repositories cloned ahead of the walkers in a pipelined run (default: 2)')
+        parser.add_argument('--commitSource', dest='commit_source', default="gitpython",
+                            choices=["gitpython", "gitlog"],
+                            help='read diffs per commit through GitPython, or stream them from a single ' +
+                            'git log -p (default: gitpython)')
+        parser.add_argument('--tokens', dest='tokens', default=",".join(TodoMatcher.DEFAULT_TOKENS),
+                            help='comma separated, case insensitive tokens marking a TODO (default: TODO,FIXME)')
+        parser.add_argument('--outputFormat', dest='output_format', default="csv",
+                            choices=["csv", "parquet"],
+                            help='format of the todos and summary tables (default: csv)')
+        parser.add_argument('--incremental', dest='incremental', action='store_true',
+                            help='fetch into existing clones and only walk commits newer than the ' +
+                            'checkpoint kept from the last run with the same run handle')
+        parser.add_argument('--trackMoves', dest='track_moves', action='store_true',
+                            help='follow TODOs a commit moves between files or edits, rather than counting ' +
+                            'them as deleted and added again')
+        parser.add_argument('--cloc', dest='cloc', action='store_true',
+                            help='also count the lines of HEAD by language into a _cloc.csv, in place of a ' +
+                            'separate cloc run; blob counts are kept between runs with the same run handle')
+        parser.add_argument('--resume', dest='resume', action='store_true',
+                            help='skip repos the run manifest of the run handle records as completed')
+        parser.add_argument('--walkJobs', dest='walk_jobs', default=1,
+                            help='number of worker processes diffing the commits of each repository (default: 1)')
+        parser.add_argument('--stopwatchFormat', dest='stopwatch_format', default=None,
+                            choices=["json", "csv"],
+                            help='also write the times and counts of each repository\'s stages to a ' +
+                            '_stopwatch file in this format (default: none)')
+        parser.add_argument('--cloneFilter', dest='clone_filter', default=None,
+                            choices=["blob:none", "tree:0"],
+                            help='partial clone filter; filtered out objects are fetched as the diffs need ' +
+                            'them (default: full clone)')
+        parser.add_argument('--reuseClones', dest='reuse_clones', action='store_true',
+                            help='fetch into clones already under the base directory instead of cloning again')
+        parser.add_argument('--mirrorDir', dest='mirror_dir', default=None,
+                            help='directory of mirror clones shared across runs; clones borrow their objects ' +
+                            'and only fetch what the mirror lacks (default: no mirrors)')
+        self.args = parser.parse_args(argv)
         
-    def open_data_file(self, repo_handle, file_handle):
-        return open(self.data_file_name(repo_handle, file_handle), "w") 
+    @contextmanager
+    def writing_file(self, path):
+        # Yields a temporary name to write path under, renamed to path once the block completes,
+        # so an interrupted run never leaves a partial file under the final name
+        tmp = path + ".tmp"
+        try:
+            yield tmp
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, path)
+    
+    @contextmanager
+    def open_data_file(self, repo_handle, file_handle, buffering = -1):
+        with self.writing_file(self.data_file_name(repo_handle, file_handle)) as path:
+            with open(path, "w", buffering) as f:
+                yield f
+    
+    def run_file_name(self, file_handle):
+        # Files of the run as a whole, rather than of one repo
+        return os.path.join(self.args.base_dir, self.args.run_handle + file_handle)
     
     def data_file_name(self, repo_handle, file_handle):
         return os.path.join(self.args.base_dir,
@@ -37,11 +113,59 @@ class TodoArgs:
     def get_remote_dir(self, repo_handle):
         return os.path.join(self.args.clone_from, repo_handle)
     
+    def get_mirror_dir(self, repo_handle):
+        if self.args.mirror_dir == None:
+            return None
+        return os.path.join(self.args.mirror_dir, repo_handle if repo_handle.endswith(".git") else repo_handle + ".git")
+    
+    def get_clone_filter(self):
+        return self.args.clone_filter
+    
+    def reuses_clones(self):
+        # A resumed run finds the clones of repos a crash cut off mid-flight
+        return self.args.reuse_clones or self.args.incremental or self.args.resume
+    
     def get_max_count(self):
         return int(self.args.max_count)
     
     def get_lines_after(self):
         return int(self.args.lines_after)
+    
+    def get_jobs(self):
+        return max(1, int(self.args.jobs))
+    
+    def is_pipelined(self):
+        return self.args.pipeline
+    
+    def get_prefetch(self):
+        return max(1, int(self.args.prefetch))
+    
+    def get_walk_jobs(self):
+        return max(1, int(self.args.walk_jobs))
+    
+    def get_commit_source(self):
+        return self.args.commit_source
+    
+    def is_incremental(self):
+        return self.args.incremental
+    
+    def is_resume(self):
+        return self.args.resume
+    
+    def tracks_moves(self):
+        return self.args.track_moves
+    
+    def counts_lines(self):
+        return self.args.cloc
+    
+    def get_output_format(self):
+        return self.args.output_format
+    
+    def get_stopwatch_format(self):
+        return self.args.stopwatch_format
+    
+    def get_matcher(self):
+        return TodoMatcher([token.strip() for token in self.args.tokens.split(",") if token.strip()])
         
     def unparse_by_repo(self, head = "", tail = ""):
         output = {}
@@ -54,153 +178,489 @@ class TodoArgs:
 
 class RepoCommitReader:
     
-    def __init__(self, repo):
+    CHECKPOINT_FIELDS = ["todos_map", "todo_aliases", "commits", "paths", "author_map", "commit_count",
+                         "oldest_commit", "newest_commit", "last_sha", "lines_after", "token_pattern",
+                         "track_moves"]
+    
+    def __init__(self, repo, matcher = None):
         self.repo = repo
+        self.matcher = (TodoMatcher() if matcher == None else matcher)
+        self.sw = Stopwatch() # Times and counts of the walks, by stage
 
+    def __getstate__(self):
+        # Sent between processes without the git repository, which is reopened where needed
+        state = dict(self.__dict__)
+        state["repo"] = None
+        return state
+    
     def get_local_repo(local):
         return RepoCommitReader(Repo(local))
         
-    def get_cloned_repo(remote, local):
-        Repo.clone_from(remote, local)
+    def update_mirror(remote, mirror, clone_filter = None):
+        # Mirrors only ever gain objects, since clones borrowing from them may need any of them
+        if os.path.isdir(mirror):
+            Repo(mirror).git.fetch("origin")
+        elif clone_filter == None:
+            Repo.clone_from(remote, mirror, mirror = True)
+        else:
+            Repo.clone_from(remote, mirror, mirror = True, filter = clone_filter)
+    
+    def get_cloned_repo(remote, local, clone_filter = None, mirror = None):
+        options = {}
+        if clone_filter != None:
+            options["filter"] = clone_filter
+        if mirror != None:
+            RepoCommitReader.update_mirror(remote, mirror, clone_filter)
+            options["reference_if_able"] = os.path.abspath(mirror)
+        Repo.clone_from(remote, local, **options)
         return RepoCommitReader.get_local_repo(local)
     
+    def is_interrupted_clone(local):
+        # A clone killed before it fetched anything has a .git whose HEAD names no commit yet
+        if not os.path.isdir(os.path.join(local, ".git")):
+            return False
+        try:
+            return not Repo(local).head.is_valid()
+        except InvalidGitRepositoryError:
+            return True
+    
+    def get_fetched_repo(remote, local, clone_filter = None, mirror = None):
+        # Brings an earlier clone up to date rather than cloning again
+        if RepoCommitReader.is_interrupted_clone(local):
+            shutil.rmtree(local)
+        if not os.path.isdir(local):
+            return RepoCommitReader.get_cloned_repo(remote, local, clone_filter, mirror)
+        if not os.path.isdir(os.path.join(local, ".git")):
+            # Whatever is there isn't ours to replace
+            raise InvalidGitRepositoryError(local + " is in the way of the clone of " + remote + " but is no git clone")
+        if mirror != None:
+            RepoCommitReader.update_mirror(remote, mirror, clone_filter)
+        repo = Repo(local)
+        repo.remotes.origin.fetch()
+        if not repo.bare and not repo.head.is_detached:
+            tracking = repo.active_branch.tracking_branch()
+            if tracking != None:
+                repo.head.reset(tracking.commit, index = True, working_tree = True)
+        return RepoCommitReader(repo)
+    
+    def canonical_body(self, todo_body):
+        # The body a TODO is kept under in todos_map, following the aliases of moved TODOs
+        while todo_body in self.todo_aliases:
+            todo_body = self.todo_aliases[todo_body]
+        return todo_body
+    
     def get_todo(self, todo_body):
-        return self.todos_map.get(todo_body, TODO(todo_body))
+        todo_body = self.canonical_body(todo_body)
+        todo = self.todos_map.get(todo_body)
+        return (TODO(todo_body, self.commits, self.paths) if todo == None else todo)
     
     def save_todo(self, todo_body, todo):
-        self.todos_map[todo_body] = todo
+        self.todos_map[self.canonical_body(todo_body)] = todo
+    
+    def alias_todo(self, todo_body, other_body):
+        # Makes both bodies name one TODO, merging the TODOs they named so far. It's kept under
+        # todo_body unless only other_body is in todos_map; either way that is the newer body, as
+        # history is walked newest first.
+        first = self.canonical_body(todo_body)
+        second = self.canonical_body(other_body)
+        if first == second:
+            return
+        if first not in self.todos_map and second in self.todos_map:
+            first, second = second, first
+        merged = self.todos_map.pop(second, None)
+        if merged != None:
+            self.todos_map[first].merge(merged)
+        self.todo_aliases[second] = first
     
     def repo_summary_measures():
         return ["Total Commits",
                 "Earliest Commit Epoch", "Latest Commit Epoch", "Days of Data",
                 "Commits from Top 1 Author","Commits from Top 25% Authors",
                 "Commits from Top 50% Authors",
-                "Commits from Top 75% Authors","Commits from All Authors"]
+                "Commits from Top 75% Authors","Commits from All Authors",
+                "Author Gini", "Bus Factor"]
+    
+    # Column types of the summary measures, for typed output formats
+    SUMMARY_DTYPES = {"Total Commits": "int64", "Earliest Commit Epoch": "float64",
+                      "Latest Commit Epoch": "float64", "Days of Data": "float64",
+                      "Commits from Top 1 Author": "int64", "Commits from Top 25% Authors": "int64",
+                      "Commits from Top 50% Authors": "int64", "Commits from Top 75% Authors": "int64",
+                      "Commits from All Authors": "int64", "Author Gini": "float64", "Bus Factor": "int64"}
     
     def get_repo_summary_measures(self):
         output = [self.commit_count, self.oldest_commit, self.newest_commit]
         output.append(CommitInfo.day_diff_from_epoch(self.oldest_commit, self.newest_commit))
         
-        quarters = []
-        quarter = int(math.floor(len(self.author_map)/4))
-        quarter = (1 if quarter == 0 else quarter)
-            
-        while len(quarters) < 5:
-            contribs = 0
-            current = len(quarters)
-            quarters.append(0)
-            while contribs < quarter or current == 4:
-                max_commits = 0
-                max_author = None
-                for author, commits in self.author_map.items():
-                    if commits > max_commits:
-                        max_commits = commits
-                        max_author = author
-                if max_author == None:
-                    break
-                    # On the last quarter, as long as current is 4, ie were in the last quarter
-                    # Or if very few contributors and we run ot of them quickly
-                self.author_map[max_author] = 0
-                contribs += 1
-                quarters[current] += max_commits
-                if current == 0:
-                    break
-                    # The first "quarter" is just the single top contributor
-        output.extend(quarters)
-        
+        # Sorted once, most commits first; the map itself is left as is
+        counts = sorted((commits for commits in self.author_map.values() if commits > 0), reverse = True)
+        output.extend(RepoCommitReader.author_quarters(counts, len(self.author_map)))
+        output.append(RepoCommitReader.author_gini(counts))
+        output.append(RepoCommitReader.bus_factor(counts))
         return output
     
+    def author_quarters(counts, author_count):
+        # Commits from the top author, then from each next quarter of the authors, the last
+        # taking whoever is left
+        quarter = max(1, author_count // 4)
+        bounds = [0, 1, 1 + quarter, 1 + 2 * quarter, 1 + 3 * quarter, len(counts)]
+        return [sum(counts[bounds[i]:bounds[i + 1]]) for i in range(5)]
+    
+    def author_gini(counts):
+        # Gini coefficient of commits over authors: 0 when all commit equally, towards 1 when
+        # one author makes every commit
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        n = len(counts)
+        # With counts descending, the author ranked i from the top is ranked n - i from the bottom
+        weighted = sum((n - i) * commits for i, commits in enumerate(counts))
+        return (2.0 * weighted) / (n * total) - (n + 1.0) / n
+    
+    def bus_factor(counts):
+        # Fewest authors that together made at least half of the commits
+        total = sum(counts)
+        covered = 0
+        for authors, commits in enumerate(counts):
+            if 2 * covered >= total:
+                return authors
+            covered += commits
+        return len(counts)
+    
     def update_commit_agg_stats(self, commit):
         
+        # The commit's author and date are read off it once, into the commit table
         self.commit_count += 1
-        self.author_map[CommitInfo.author(commit)] = self.author_map.get(CommitInfo.author(commit), 0) + 1
-        epoch = CommitInfo.epoch_time(commit)
+        commit_index = self.commits.add(commit)
+        author = self.commits.author(commit_index)
+        self.author_map[author] = self.author_map.get(author, 0) + 1
+        epoch = self.commits.epochs[commit_index]
         self.oldest_commit = (epoch if epoch < self.oldest_commit else self.oldest_commit)
         self.newest_commit = (epoch if epoch > self.newest_commit else self.newest_commit)
         
-    def update_with_raw_diff(self, diff, lines_after, commit, token_regex = r'(?i)TODO|FIXME'):
+    def find_file_divider(text, pos):
+        # Start of the first line from pos (a line start) on that is exactly "---", or -1
+        start = text.find("---", pos)
+        while start >= 0:
+            if ((start == pos or text[start - 1] == "\n")
+                and (start + 3 == len(text) or text[start + 3] == "\n")):
+                return start
+            start = text.find("---", start + 1)
+        return -1
+    
+    def parse_raw_diff(diff, lines_after, matcher = None):
+        # Returns the paths touched and the TODODiffs found in one changed file, without
+        # updating any state, so that it can also run in a worker process.
+        # Splits into (path, body) sections the way a line by line walk would: the first line
+        # names the file, and a line that is just "---" means the next one names a file again.
+        # Only the lines the matcher finds in each body are looked at, if any.
 
+        matcher = (TodoMatcher() if matcher == None else matcher)
+        text = str(diff)
+        paths = []
         todo_diffs = []
-        file_ended = True
-        current_path = ""
-        lines = str(diff).split("\n") # FIXME: rly not using gitpython much, better use own wrapper   
-        
-       
-        #print("------------------------")
-        # print(commit)
-        #print(str(diff))
-        
-        for index, line in enumerate(lines):
-            if file_ended:
-                current_path = line
-                self.path_touches[current_path] = self.path_touches.get(current_path, 0) + 1
-                file_ended = False
-            else:
-                if line == "---":
-                    file_ended = True
-                elif len(re.findall(token_regex, line)) > 0:
-                    context = " ".join(s[2:].strip() for s in lines[index:index + 1 + lines_after])
-                    if line.startswith("+ ") or line.startswith("- "):
-                        todo_diffs.append(TODODiff(('A' if line.startswith("+") else 'D'),
-                                          line[2:], context, current_path))
-                        
-        self.update_with_diff_list(commit, todo_diffs)
+        
+        may_match = matcher.may_match(text)
+        pos = 0
+        while True:
+            path_end = text.find("\n", pos)
+            path_end = (len(text) if path_end < 0 else path_end)
+            current_path = text[pos:path_end]
+            paths.append(current_path)
+            
+            divider = RepoCommitReader.find_file_divider(text, path_end + 1)
+            body_end = (len(text) if divider < 0 else divider)
+            
+            for start, end in (matcher.matching_lines(text, path_end + 1, body_end) if may_match else ()):
+                if text.startswith("+ ", start) or text.startswith("- ", start):
+                    context_end = end
+                    for _ in range(lines_after):
+                        if context_end >= len(text):
+                            break
+                        context_end = text.find("\n", context_end + 1)
+                        context_end = (len(text) if context_end < 0 else context_end)
+                    context = " ".join(s[2:].strip() for s in text[start:context_end].split("\n"))
+                    todo_diffs.append(TODODiff(('A' if text[start] == "+" else 'D'),
+                                      text[start + 2:end], context, current_path))
+            
+            if divider < 0 or divider + 3 >= len(text):
+                return paths, todo_diffs
+            pos = divider + 4
+        
+    def parse_renames(text):
+        # The (from, to) paths of a file str(Diff) says was renamed, in a list
+        header_end = text.find("\n---")
+        start = text.find("\nfile renamed from ", 0, (len(text) if header_end < 0 else header_end))
+        if start < 0:
+            return []
+        lines = text[start + 1:].split("\n", 2)
+        return [(ast.literal_eval(lines[0][len("file renamed from "):]),
+                 ast.literal_eval(lines[1][len("file renamed to "):]))]
+    
+    def parse_changed_file(text, lines_after, matcher = None):
+        # parse_raw_diff, along with the file's rename. A pure rename or mode change has no blob
+        # for str(Diff) to name the file by, leaving "%s", so a renamed one goes by its old name.
+        paths, todo_diffs = RepoCommitReader.parse_raw_diff(text, lines_after, matcher)
+        renames = RepoCommitReader.parse_renames(text)
+        if paths == ["%s"]:
+            paths = [old_path for old_path, new_path in renames]
+        return paths, todo_diffs, renames
+    
+    # The update_with_*_diff methods count the paths one changed file touches and return its
+    # TODODiffs, which update_with_diff_list takes for a whole commit at once
+    def update_with_raw_diff(self, diff, lines_after, commit):
+        with self.sw.timer("parse diff"):
+            text = str(diff)
+            parsed_file = RepoCommitReader.parse_changed_file(text, lines_after, self.matcher)
+        self.sw.count("diff bytes", len(text))
+        return self.update_with_parsed_diff(commit, *parsed_file)
+        
+    def update_with_parsed_diff(self, commit, paths, todo_diffs, renames = ()):
+        self.sw.count("todo lines matched", len(todo_diffs))
+        # The file goes by its old name in the diff and in the older commits still to be walked
+        for old_path, new_path in renames:
+            self.paths.rename(old_path, new_path)
+            self.sw.count("renames followed")
+        for path in paths:
+            self.paths.touch(path)
+        return todo_diffs
     
     def update_with_diff_list(self, commit, todo_diffs):
 
         # Note that we're pretty much just tossing body vs context out the window here, and using
         # the longer context form, rather than body
-        for todo_diff in todo_diffs:
+        commit_index = (self.commits.add(commit) if len(todo_diffs) > 0 else None)
+        
+        # A TODO the commit moves or edits is neither added nor deleted by it
+        moved = set()
+        if self.track_moves and len(todo_diffs) > 1:
+            with self.sw.timer("pair moves"):
+                for deleted, added in self.identity.pair_moves(todo_diffs):
+                    self.alias_todo(todo_diffs[added].body, todo_diffs[deleted].body)
+                    moved.update((deleted, added))
+            self.sw.count("todos moved", len(moved) // 2)
+        
+        for diff_index, todo_diff in enumerate(todo_diffs):
             
             todo = self.get_todo(todo_diff.body)
             
-            if todo_diff.diff_type == 'A':
-                todo.added_in_commit(commit)
-            if todo_diff.diff_type == 'D':
-                todo.deleted_in_commit(commit)
-            todo.touched_by(todo_diff.path)
+            if todo_diff.diff_type == 'A' and diff_index not in moved:
+                todo.added_in_commit(commit_index)
+            if todo_diff.diff_type == 'D' and diff_index not in moved:
+                todo.deleted_in_commit(commit_index)
+            todo.touched_by(self.paths.path_id(todo_diff.path))
             todo.add_context(todo_diff.context)
             
             self.save_todo(todo_diff.body, todo)
 
-    def iterate_over_commits(self, max_count = -1, lines_after = 1):
+    def commit_diff(commit):
+        return ( commit.parents[0].diff(commit, create_patch = True) 
+                 if len(commit.parents)>0
+                 else commit.diff(NULL_TREE, create_patch = True) )
+    
+    def diff_shard(git_dir, shas, lines_after, matcher):
+        # Worker side of the sharded walk: parses every changed file of every commit in the shard,
+        # returning one list of (paths, todo_diffs, renames) per commit, in the order of shas, and the
+        # worker's stopwatch
+        repo = Repo(git_dir)
+        sw = Stopwatch()
+        output = []
+        for sha in shas:
+            with sw.timer("diff"):
+                changed_files = RepoCommitReader.commit_diff(repo.commit(sha))
+            parsed_files = []
+            for changed_file in changed_files:
+                with sw.timer("parse diff"):
+                    text = str(changed_file)
+                    parsed_files.append(RepoCommitReader.parse_changed_file(text, lines_after, matcher))
+                sw.count("diff bytes", len(text))
+            output.append(parsed_files)
+        return output, sw
+    
+    def iter_shards(commits, shard_count):
+        shard_size = max(1, int(math.ceil(len(commits) / shard_count)))
+        for start in range(0, len(commits), shard_size):
+            yield commits[start:start + shard_size]
     
-        # We zero all the counts once this is invoked.
-        self.path_touches = {} # Map from file paths to number of times they were touched
+    def iter_parsed_commits(self, commits, lines_after, jobs):
+        # Diffs are parsed by jobs worker processes, several shards each to even out the load.
+        # pool.map hands shards back in history order, so the merge replays the serial walk.
+        shards = list(RepoCommitReader.iter_shards(list(commits), jobs * 4))
+        with ProcessPoolExecutor(max_workers = jobs) as pool:
+            parsed_shards = pool.map(RepoCommitReader.diff_shard, repeat(self.repo.git_dir),
+                                     ([commit.hexsha for commit in shard] for shard in shards),
+                                     repeat(lines_after), repeat(self.matcher))
+            for shard, (parsed_shard, shard_sw) in zip(shards, parsed_shards):
+                # Worker time overlaps the walk's, so it's kept apart under "workers"
+                self.sw.merge(shard_sw, "workers/")
+                for commit, parsed_files in zip(shard, parsed_shard):
+                    yield commit, parsed_files
+    
+    def parse_log_file(log_file, lines_after, matcher, parsed_files, sw):
+        # Timed as "parse diff" like str(Diff) and its parse are on the other sources
+        if log_file == None:
+            return
+        with sw.timer("parse diff"):
+            raw_diff = log_file.raw_diff()
+            if raw_diff != None:
+                parsed_files.append(RepoCommitReader.parse_changed_file(raw_diff, lines_after, matcher))
+    
+    def iter_log_commits(self, rev, max_count, lines_after):
+        # Streams one `git log -p` for the whole history instead of a GitPython Diff per commit.
+        # Each changed file is rebuilt in the shape of str(Diff), so parse_changed_file sees the same text.
+        log_args = {"p": True, "M": True, "full_index": True, "no_ext_diff": True, "no_color": True,
+                    "diff_merges": "first-parent", "format": CommitRecord.LOG_FORMAT, "as_process": True}
+        if max_count > 0:
+            log_args["max_count"] = max_count
+        self.repo.git(c = ["diff.mnemonicPrefix=false", "diff.noprefix=false", "core.quotePath=false"])
+        proc = self.repo.git.log(rev, **log_args)
+        
+        commit = None
+        parsed_files = []
+        log_file = None
+        log_bytes = 0
+        for line in proc.stdout:
+            log_bytes += len(line)
+            if line.startswith(b"\x00") or line.startswith(b"diff --git "):
+                RepoCommitReader.parse_log_file(log_file, lines_after, self.matcher, parsed_files, self.sw)
+                log_file = None
+                if line.startswith(b"diff --git "):
+                    log_file = LogFileDiff(line)
+                    continue
+                if commit != None:
+                    yield commit, parsed_files
+                commit = CommitRecord.from_log_header(line)
+                parsed_files = []
+            elif log_file != None:
+                log_file.add_line(line)
+        
+        RepoCommitReader.parse_log_file(log_file, lines_after, self.matcher, parsed_files, self.sw)
+        self.sw.count("diff bytes", log_bytes)
+        if commit != None:
+            yield commit, parsed_files
+        proc.wait()
+    
+    def reset_counts(self):
+        self.paths = PathTable() # Paths touched, and the number of times each was
         self.todos_map = {} # Map from todo_body to a TODO object with that body
+        self.todo_aliases = {} # Map from the earlier bodies of moved or edited TODOs to the one they're kept under
         self.commit_count = 0 # Count of commits in the dataset
         self.oldest_commit = time.time() # Oldest commit in our dataset
         self.newest_commit = 0 # Most recent commit in our dataset
         self.author_map = {} # Map the number of commits from each author
+        self.commits = CommitTable() # Commits walked, as referred to by TODOs
+        self.last_sha = None # Newest commit walked, where an incremental walk picks up from
+        self.lines_after = None
+        self.token_pattern = None
+        self.track_moves = False
+    
+    def can_resume(self, lines_after, track_moves):
+        # Only worth resuming when the checkpoint was walked alike and HEAD still descends from it
+        if (getattr(self, "last_sha", None) == None or self.lines_after != lines_after
+            or self.token_pattern != self.matcher.pattern.pattern or self.track_moves != track_moves):
+            return False
+        try:
+            return self.repo.is_ancestor(self.last_sha, "HEAD")
+        except Exception:
+            return False
+    
+    def iterate_over_commits(self, max_count = -1, lines_after = 1, jobs = 1, source = "gitpython",
+                             resume = False, matcher = None, track_moves = False):
+    
+        # We zero all the counts once this is invoked, unless resuming from a loaded checkpoint,
+        # in which case only commits newer than it are walked.
+        self.matcher = (self.matcher if matcher == None else matcher)
+        rev = "HEAD"
+        if resume and self.can_resume(lines_after, track_moves):
+            rev = self.last_sha + "..HEAD"
+        else:
+            self.reset_counts()
+        self.paths.start_walk()
+        self.lines_after = lines_after
+        self.token_pattern = self.matcher.pattern.pattern
+        self.track_moves = track_moves
+        self.identity = (TodoIdentity() if track_moves else None)
         
-        for commit in (self.repo.iter_commits(max_count = max_count)
-                       if max_count > 0 else self.repo.iter_commits()):
-            self.update_commit_agg_stats(commit)
-           
-            diff =  ( commit.parents[0].diff(commit, create_patch = True) 
-                     if len(commit.parents)>0
-                     else commit.diff(NULL_TREE, create_patch = True) )
-            
-            if len(commit.parents) == 0:
+        commits = (self.repo.iter_commits(rev, max_count = max_count)
+                   if max_count > 0 else self.repo.iter_commits(rev))
+        
+        if source == "gitlog" or jobs > 1:
+            parsed_commits = (self.iter_log_commits(rev, max_count, lines_after) if source == "gitlog"
+                              else self.iter_parsed_commits(commits, lines_after, jobs))
+        else:
+            parsed_commits = ((commit, None) for commit in commits)
+        
+        head_sha = None
+        with self.sw.timer("walk"):
+            for commit, parsed_files in parsed_commits:
+                head_sha = (commit.hexsha if head_sha == None else head_sha) # History is walked newest first
+                self.update_commit_agg_stats(commit)
+                self.sw.count("commits")
+                
+                if len(commit.parents) == 0:
                     print("0- parent commit: " + str(commit))
-            
-            for changed_file in diff:
-                self.update_with_raw_diff(changed_file, lines_after, commit)
+                
+                commit_diffs = []
+                if parsed_files == None:
+                    with self.sw.timer("diff"):
+                        changed_files = RepoCommitReader.commit_diff(commit)
+                    for changed_file in changed_files:
+                        commit_diffs.extend(self.update_with_raw_diff(changed_file, lines_after, commit))
+                else:
+                    for parsed_file in parsed_files:
+                        commit_diffs.extend(self.update_with_parsed_diff(commit, *parsed_file))
+                self.update_with_diff_list(commit, commit_diffs)
         
+        if head_sha != None:
+            self.last_sha = head_sha
+    
+    def save_checkpoint(self, path):
+        state = {key: getattr(self, key) for key in RepoCommitReader.CHECKPOINT_FIELDS}
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    
+    def load_checkpoint(self, path):
+        if not os.path.isfile(path):
+            return False
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if any(key not in state for key in RepoCommitReader.CHECKPOINT_FIELDS):
+            return False # Kept by an older version, so walked afresh
+        for key in RepoCommitReader.CHECKPOINT_FIELDS:
+            setattr(self, key, state[key])
+        return True
+    
     def get_todos_map(self):
         return self.todos_map
     
-    def get_path_touches(self, path):
-        return self.path_touches.get(path, 0)
+    def get_path_touches(self, path_id):
+        return self.paths.touches[path_id]
+    
+    def get_filetouches(self):
+        # Filetouches of every TODO, in todos_map order, summed in one pass over all their path ids
+        todos = list(self.todos_map.values())
+        path_counts = np.fromiter((len(todo.filepaths) for todo in todos), dtype = np.int64, count = len(todos))
+        path_ids = np.fromiter((path_id for todo in todos for path_id in todo.filepaths), dtype = np.int64,
+                               count = int(path_counts.sum()))
+        touches = np.frombuffer(self.paths.touches, dtype = self.paths.touches.typecode)
+        owners = np.repeat(np.arange(len(todos)), path_counts)
+        return np.bincount(owners, weights = touches[path_ids], minlength = len(todos)).astype(np.int64).tolist()
 
 class TODO:
+    
+    # A repo can have hundreds of thousands of these, so they keep commit indices into the
+    # reader's CommitTable rather than commits, path ids into its PathTable rather than paths,
+    # and no per instance __dict__
+    __slots__ = ["body", "added", "deleted", "contexts", "filepaths", "commits", "paths"]
 
-    def __init__(self, TODO_body):
+    def __init__(self, TODO_body, commits = None, paths = None):
         self.body = TODO_body
-        self.added = []
-        self.deleted = []
+        self.added = array("l")
+        self.deleted = array("l")
         self.contexts = set()
         self.filepaths = set()
+        self.commits = commits
+        self.paths = paths
         
     def touched_by(self, filepath):
         self.filepaths.add(filepath)
@@ -213,28 +673,40 @@ class TODO:
         
     def add_context(self, context):
         self.contexts.add(context)
+    
+    def merge(self, other):
+        # Takes in the history of other, found to be this same TODO under another body
+        self.added.extend(other.added)
+        self.deleted.extend(other.deleted)
+        self.contexts |= other.contexts
+        self.filepaths |= other.filepaths
         
-    def added_in_commit(self, commit):
-        self.added.append(commit)
+    def added_in_commit(self, commit_index):
+        self.added.append(commit_index)
             
-    def deleted_in_commit(self, commit):
-        self.deleted.append(commit)
+    def deleted_in_commit(self, commit_index):
+        self.deleted.append(commit_index)
             
     def time_measures():
         return ["Added", "Deleted", "Age", "Filetouches"]
     
-    def get_time_measures(self, rcr):
-        return [CommitInfo.human_readable_from_epoch(CommitInfo.earliest_epoch(self.added)),
-                CommitInfo.human_readable_from_epoch(CommitInfo.latest_epoch(self.deleted)),
-                CommitInfo.day_diff_from_set(self.added, self.deleted, rcr.oldest_commit, rcr.newest_commit),
-                self.count_touches(rcr)]
+    def get_time_measures(self, rcr, filetouches = None):
+        # filetouches, when given, is this TODO's from rcr.get_filetouches()
+        added = self.commits.earliest_epoch(self.added)
+        deleted = self.commits.latest_epoch(self.deleted)
+        return [CommitInfo.human_readable_from_epoch(added),
+                CommitInfo.human_readable_from_epoch(deleted),
+                CommitInfo.day_diff_from_epoch(rcr.oldest_commit if added == None else added,
+                                               rcr.newest_commit if deleted == None else deleted),
+                self.count_touches(rcr) if filetouches == None else filetouches]
     
     def author_measures():
         return ["Author Union", "Author Intersect"]
     
     def get_author_measures(self):
-        return [len(CommitInfo.authors(self.added, self.deleted)),
-               len(CommitInfo.author_intersect(self.added, self.deleted))]
+        added_authors = self.commits.author_ids(self.added)
+        deleted_authors = self.commits.author_ids(self.deleted)
+        return [len(added_authors | deleted_authors), len(added_authors & deleted_authors)]
     
     def plaintext_measures():
         return ["safe body", "safe contexts", "filepaths"]
@@ -242,25 +714,151 @@ class TODO:
     def get_plaintext_measures(self):
         body = self.body.replace('\n', '\\n').replace('\r', '').strip()
         contexts = (c.replace('\n', '\\n').replace('\r', '').strip() for c in self.contexts)
-        return [body, ";;;".join(contexts), ";".join(self.filepaths)]
+        filepaths = (self.filepaths if self.paths == None else {self.paths.names[path_id] for path_id in self.filepaths})
+        # Sorted, as set order changes from one process to the next
+        return [body, ";;;".join(sorted(contexts)), ";".join(sorted(filepaths))]
+    
+    def write_description(self, f):
+        # The body, its commits and authors, written piece by piece
+        added_authors = self.commits.author_ids(self.added)
+        deleted_authors = self.commits.author_ids(self.deleted)
+        union = added_authors | deleted_authors
+        intersect = added_authors & deleted_authors
+        f.write(self.body)
+        for sign, commit_indices in (("+", self.added), ("-", self.deleted)):
+            for commit_index in commit_indices:
+                f.write("\n" + sign + " " + self.commits.shas[commit_index]
+                        + "\n  " + self.commits.author(commit_index))
+        f.write("\n Author Union Len: " + str(len(union)))
+        for author_id in union:
+            f.write("\nU " + self.commits.authors[author_id])
+        f.write("\n Author Intersect Len: " + str(len(intersect)))
+        for author_id in intersect:
+            f.write("\n^ " + self.commits.authors[author_id])
     
     def __str__(self):
-        output = self.body
-        union = CommitInfo.authors(self.added, self.deleted)
-        intersect = CommitInfo.author_intersect(self.added, self.deleted)
-        for commit in self.added:
-            output = output + "\n+ " + str(commit)
-            output = output + "\n  " + str(CommitInfo.author(commit))
-        for commit in self.deleted:
-            output = output + "\n- " + str(commit)
-            output = output + "\n  " + str(CommitInfo.author(commit))
-        output = output + "\n Author Union Len: " + str(len(union))
-        for author in union:
-            output = output + "\nU " + str(author)
-        output = output + "\n Author Intersect Len: " + str(len(intersect))
-        for author in intersect:
-            output = output + "\n^ " + str(author)
-        return output
+        output = io.StringIO()
+        self.write_description(output)
+        return output.getvalue()
+    
+class TodoMatcher:
+    # Locates lines holding any of the tokens, with one precompiled pattern over a whole patch
+    
+    DEFAULT_TOKENS = ["TODO", "FIXME"]
+    
+    def __init__(self, tokens = None, pattern = None):
+        self.needles = None
+        if pattern == None:
+            tokens = (TodoMatcher.DEFAULT_TOKENS if tokens == None else tokens)
+            pattern = "(?i)" + "|".join(re.escape(token) for token in tokens)
+            if all(token.isascii() for token in tokens):
+                self.needles = [token.lower() for token in tokens]
+        self.pattern = re.compile(pattern)
+    
+    def may_match(self, text):
+        # Case insensitive regex search is slow next to str.find, and most patches hold no token
+        # at all, so plain tokens are first looked for in the lowered text. Only done for ascii
+        # text, where lowering is exactly what the regex's case folding does.
+        if self.needles == None or not text.isascii():
+            return True
+        lowered = text.lower()
+        return any(needle in lowered for needle in self.needles)
+        
+    def matching_lines(self, text, pos = 0, endpos = None):
+        # Yields (start, end) of each line between pos and endpos with a match, once per line
+        endpos = (len(text) if endpos == None else endpos)
+        match = self.pattern.search(text, pos, endpos)
+        while match != None:
+            start = text.rfind("\n", 0, match.start()) + 1
+            end = text.find("\n", match.end())
+            end = (len(text) if end < 0 else end)
+            yield start, end
+            match = self.pattern.search(text, end + 1, endpos)
+    
+class TodoIdentity:
+    # Pairs the TODOs one commit deletes with the ones it adds that are the same TODO, moved to
+    # another file or edited. Bodies equal once punctuation, whitespace and case are normalized
+    # away pair first, by hash. The rest pair by MinHash signatures of their contexts, split into
+    # bands, so only TODOs sharing a whole band are ever compared and a large refactoring commit
+    # costs about linear time rather than a comparison of every delete with every add.
+    
+    PERMUTATIONS = 32
+    BANDS = 8 # Of PERMUTATIONS / BANDS signature rows each
+    SHINGLE = 4 # Characters per shingle
+    THRESHOLD = 0.5 # Least estimated Jaccard similarity of a pair
+    CANDIDATES = 16 # Deletes compared per band bucket
+    PRIME = (1 << 31) - 1 # Keeps a * hash + b, with 32 bit hashes, within 64 bits
+    
+    def __init__(self, seed = 0):
+        rand = random.Random(seed)
+        self.a = np.array([rand.randrange(1, TodoIdentity.PRIME) for _ in range(TodoIdentity.PERMUTATIONS)],
+                          dtype = np.uint64)[:, None]
+        self.b = np.array([rand.randrange(TodoIdentity.PRIME) for _ in range(TodoIdentity.PERMUTATIONS)],
+                          dtype = np.uint64)[:, None]
+    
+    def normalize(text):
+        return " ".join(re.sub(r"[\W_]+", " ", text).split()).lower()
+    
+    def signature(self, text):
+        text = TodoIdentity.normalize(text)
+        # crc32 rather than hash(), which differs from one process to the next
+        shingles = {zlib.crc32(text[start:start + TodoIdentity.SHINGLE].encode("utf-8"))
+                    for start in range(max(1, len(text) - TodoIdentity.SHINGLE + 1))}
+        hashes = np.fromiter(shingles, dtype = np.uint64, count = len(shingles))[None, :]
+        return ((self.a * hashes + self.b) % TodoIdentity.PRIME).min(axis = 1)
+    
+    def bands(signature):
+        rows = TodoIdentity.PERMUTATIONS // TodoIdentity.BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(TodoIdentity.BANDS)]
+    
+    def pair_moves(self, todo_diffs):
+        # Returns (delete index, add index) pairs into todo_diffs, each index in at most one pair
+        deletes = [i for i, todo_diff in enumerate(todo_diffs) if todo_diff.diff_type == 'D']
+        adds = [i for i, todo_diff in enumerate(todo_diffs) if todo_diff.diff_type == 'A']
+        if len(deletes) == 0 or len(adds) == 0:
+            return []
+        pairs = []
+        
+        by_body = {} # Map from normalized body to the unpaired deletes with it
+        for i in deletes:
+            by_body.setdefault(TodoIdentity.normalize(todo_diffs[i].body), []).append(i)
+        unpaired_adds = []
+        for i in adds:
+            same = by_body.get(TodoIdentity.normalize(todo_diffs[i].body))
+            if same:
+                pairs.append((same.pop(0), i))
+            else:
+                unpaired_adds.append(i)
+        unpaired_deletes = [i for same in by_body.values() for i in same]
+        if len(unpaired_deletes) == 0 or len(unpaired_adds) == 0:
+            return pairs
+        
+        signatures = {}
+        buckets = {} # Map from (band, band rows) to the deletes with them
+        for i in sorted(unpaired_deletes):
+            signatures[i] = self.signature(todo_diffs[i].context)
+            for key in TodoIdentity.bands(signatures[i]):
+                buckets.setdefault(key, deque()).append(i)
+        paired = set()
+        for i in unpaired_adds:
+            signature = self.signature(todo_diffs[i].context)
+            # Only the first unpaired deletes of each bucket are compared, which bounds the work
+            # on commits full of near identical TODOs
+            candidates = set()
+            for key in TodoIdentity.bands(signature):
+                bucket = buckets.get(key, ())
+                while len(bucket) > 0 and bucket[0] in paired:
+                    bucket.popleft()
+                candidates.update(islice((j for j in bucket if j not in paired), TodoIdentity.CANDIDATES))
+            if len(candidates) == 0:
+                continue
+            candidates = sorted(candidates)
+            similarities = (np.stack([signatures[j] for j in candidates]) == signature).mean(axis = 1)
+            best = int(similarities.argmax())
+            if similarities[best] >= TodoIdentity.THRESHOLD:
+                paired.add(candidates[best])
+                pairs.append((candidates[best], i))
+        return pairs
     
 class TODODiff:
     
@@ -271,6 +869,174 @@ class TODODiff:
         self.context = context
         self.path = path
         
+class LogFileDiff:
+    # One changed file out of a `git log -p` stream, collected as raw bytes
+    
+    def __init__(self, header):
+        self.header_path = LogFileDiff.path_from_header(header)
+        self.a_path = None
+        self.b_path = None
+        self.new_file = False
+        self.renamed = False
+        self.has_index = False
+        self.patch = []
+    
+    def unquote(path):
+        path = path.rstrip(b"\n")
+        if path.endswith(b"\t"): # git pads names containing spaces with a tab
+            path = path[:-1]
+        if path.startswith(b'"') and path.endswith(b'"'):
+            path = codecs.escape_decode(path[1:-1])[0]
+        return path.decode("utf-8", "replace")
+    
+    def path_from_header(header):
+        # "diff --git a/X b/X" is only unambiguous when both sides are the same path
+        rest = header[len(b"diff --git "):].rstrip(b"\n")
+        half = (len(rest) - 1) // 2
+        if rest[2:half] == rest[half + 3:]:
+            return LogFileDiff.unquote(rest[:half])[2:]
+        return None
+    
+    def add_line(self, line):
+        if len(self.patch) > 0 or line.startswith(b"@@") or line.startswith(b"Binary files "):
+            if line != b"\n": # blank separator before the next commit, never a patch line
+                self.patch.append(line)
+        elif line.startswith(b"new file mode"):
+            self.new_file = True
+        elif line.startswith(b"index "):
+            self.has_index = True
+        elif line.startswith(b"rename from "):
+            self.renamed = True
+            self.a_path = LogFileDiff.unquote(line[len(b"rename from "):])
+        elif line.startswith(b"rename to "):
+            self.b_path = LogFileDiff.unquote(line[len(b"rename to "):])
+        elif line.startswith(b"--- ") and line.rstrip(b"\n") != b"--- /dev/null":
+            self.a_path = LogFileDiff.unquote(line[len(b"--- "):])[2:]
+        elif line.startswith(b"+++ ") and line.rstrip(b"\n") != b"+++ /dev/null":
+            self.b_path = LogFileDiff.unquote(line[len(b"+++ "):])[2:]
+    
+    def path(self):
+        # Same side GitPython names a Diff by: the a blob, unless the file is new
+        if self.new_file:
+            return self.b_path or self.header_path or ""
+        return self.a_path or self.header_path or ""
+    
+    def raw_diff(self):
+        # Mirrors str(Diff): there is no "---" section without a patch, and GitPython has no blob to
+        # name a file by without an index line (pure renames, mode changes), so those are left
+        # unnamed, and give None unless renamed
+        renames = ("\nfile renamed from %r\nfile renamed to %r" % (self.a_path, self.b_path) if self.renamed else "")
+        if not self.has_index:
+            return ("%s" + renames if self.renamed else None)
+        if len(self.patch) == 0:
+            return self.path() + renames
+        try:
+            patch = b"".join(self.patch).decode("utf-8")
+        except UnicodeDecodeError:
+            patch = "OMITTED BINARY DATA"
+        return self.path() + renames + "\n---" + patch + "\n---"
+
+class CommitRecord:
+    # Just enough of a GitPython Commit for CommitInfo and TODO, for commits read from git log
+    
+    LOG_FORMAT = "%x00%H%x00%at%x00%ae%x00%P"
+    
+    def __init__(self, hexsha, authored_date, author_email, parents = ()):
+        self.hexsha = hexsha
+        self.authored_date = authored_date
+        self.author = Actor(None, author_email)
+        self.parents = list(parents)
+    
+    def from_log_header(line):
+        _, hexsha, authored_date, author_email, parents = line.decode("utf-8", "replace").rstrip("\n").split("\x00")
+        return CommitRecord(hexsha, int(authored_date), author_email, parents.split())
+    
+    def __str__(self):
+        return self.hexsha
+    
+class CommitTable:
+    # Columns of every commit a reader walked, indexed in walk order: TODOs hold these indices,
+    # and authors are interned into small integer ids
+    
+    def __init__(self):
+        self.index = {} # Map from hexsha to commit index
+        self.shas = []
+        self.epochs = array("q")
+        self.author_index = {} # Map from author email to author id
+        self.authors = []
+        self.author_of = array("l") # Author id of each commit
+    
+    def __len__(self):
+        return len(self.shas)
+    
+    def add(self, commit):
+        commit_index = self.index.get(commit.hexsha)
+        if commit_index == None:
+            commit_index = len(self.shas)
+            self.index[commit.hexsha] = commit_index
+            self.shas.append(commit.hexsha)
+            self.epochs.append(CommitInfo.epoch_time(commit))
+            self.author_of.append(self.author_id(CommitInfo.author(commit)))
+        return commit_index
+    
+    def author_id(self, author):
+        author_id = self.author_index.get(author)
+        if author_id == None:
+            author_id = len(self.authors)
+            self.author_index[author] = author_id
+            self.authors.append(author)
+        return author_id
+    
+    def author(self, commit_index):
+        return self.authors[self.author_of[commit_index]]
+    
+    def author_ids(self, commit_indices):
+        return {self.author_of[i] for i in commit_indices}
+    
+    def earliest_epoch(self, commit_indices, default = None):
+        return (min(self.epochs[i] for i in commit_indices) if len(commit_indices) > 0 else default)
+    
+    def latest_epoch(self, commit_indices, default = None):
+        return (max(self.epochs[i] for i in commit_indices) if len(commit_indices) > 0 else default)
+    
+class PathTable:
+    # Paths a reader saw changed, interned into small integer ids, with the times each was
+    # touched. History is walked newest first, so from the commit renaming a file on, its old
+    # name is looked up to the same id, and touches under either name count together.
+    
+    def __init__(self):
+        self.index = {} # Map from path, as named at the commit being walked, to path id
+        self.head_index = {} # Map from path, as first named in a walk, to path id
+        self.names = [] # Newest name of each path id
+        self.touches = array("l")
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def start_walk(self):
+        # A resumed walk goes over newer commits than the last one, naming files as its first did.
+        # Renames between the two walks aren't followed.
+        self.index = dict(self.head_index)
+    
+    def path_id(self, path):
+        path_id = self.index.get(path)
+        if path_id == None:
+            path_id = len(self.names)
+            self.index[path] = path_id
+            self.head_index.setdefault(path, path_id)
+            self.names.append(path)
+            self.touches.append(0)
+        return path_id
+    
+    def touch(self, path):
+        self.touches[self.path_id(path)] += 1
+    
+    def rename(self, old_path, new_path):
+        # Whatever went by old_path in newer commits keeps its id, but older ones mean this file
+        path_id = self.path_id(new_path)
+        del self.index[new_path]
+        self.index[old_path] = path_id
+    
 class CommitInfo:
     
     def epoch_time(commit):
@@ -279,16 +1045,30 @@ class CommitInfo:
     def author(commit):
         return commit.author.email
                               
+    HUMAN_READABLE_FORMAT = "%a, %d %b %Y %H:%M"
+    CACHED_TIMES = 1 << 16 # Conversions remembered each way, as many TODOs share their commits
+    
+    # Human readable times are written in UTC, so they are read back as UTC
     def epoch_from_human_readable(strtime, default = None):
         if pd.isnull(strtime):
             return (0 if default == None else CommitInfo.epoch_from_human_readable(default, None))
-        dt = datetime.datetime.strptime(strtime, "%a, %d %b %Y %H:%M")
-        return time.mktime(dt.timetuple())
+        return CommitInfo.parse_human_readable(strtime)
+    
+    @lru_cache(maxsize = CACHED_TIMES)
+    def parse_human_readable(strtime):
+        dt = datetime.datetime.strptime(strtime, CommitInfo.HUMAN_READABLE_FORMAT)
+        return calendar.timegm(dt.timetuple())
+    
+    def epochs_from_human_readable(strtimes):
+        # Vectorized epoch_from_human_readable for a Series, with NaN where missing
+        parsed = pd.to_datetime(strtimes, format = CommitInfo.HUMAN_READABLE_FORMAT, errors = "coerce")
+        return (parsed - pd.Timestamp(0)) / pd.Timedelta(seconds = 1)
         
+    @lru_cache(maxsize = CACHED_TIMES)
     def human_readable_from_epoch(epoch):
         if epoch == None:
             return "N/A"
-        return time.strftime("%a, %d %b %Y %H:%M", time.gmtime(epoch))
+        return time.strftime(CommitInfo.HUMAN_READABLE_FORMAT, time.gmtime(epoch))
     
     def day_diff_from_set(commits_added, commits_deleted, default_min_date, default_max_date):
         return CommitInfo.day_diff_from_epoch(CommitInfo.earliest_epoch(commits_added, default_min_date),
@@ -332,8 +1112,4 @@ class CommitInfo:
         return output
     
     def author_intersect(commits_x, commits_y):
-        output = set()
-        for a in CommitInfo.authors(commits_x):
-            if a in CommitInfo.authors(commits_y):
-                output.add(a)
-        return output
+        return CommitInfo.authors(commits_x) & CommitInfo.authors(commits_y)
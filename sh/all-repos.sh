@@ -1,4 +1,31 @@
-for D in "$@" 
+#   ./all-repos.sh [--resume] directory_of_repo ...
+
+#   Each repo's counts are written to a temporary file and renamed once bba.sh succeeds, and
+#   all-repos_manifest.txt records which repos completed or failed. With --resume, repos the
+#   manifest already records as completed are skipped.
+
+set -o pipefail
+
+MANIFEST=all-repos_manifest.txt
+RESUME=0
+if [ "$1" == "--resume" ]
+then
+   RESUME=1
+   shift
+fi
+
+for D in "$@"
 do
-   ./bba.sh ${D} | tee  ${D}.txt  
+   if [ ${RESUME} -eq 1 ] && grep -qxF "completed ${D}" ${MANIFEST} 2> /dev/null
+   then
+      continue
+   fi
+   if ./bba.sh ${D} | tee  ${D}.txt.tmp
+   then
+      mv ${D}.txt.tmp ${D}.txt
+      echo "completed ${D}" >> ${MANIFEST}
+   else
+      rm -f ${D}.txt.tmp
+      echo "failed ${D}" >> ${MANIFEST}
+   fi
 done
@@ -1,11 +1,18 @@
+/*
+ * These read the monthly_rollups sums that python/sqlload.py keeps per repo and month, rather
+ * than aggregating the whole commits table. Per commit densities are lines per thousand, and an
+ * average over commits is the summed densities over the commits summed.
+ */
+
 /*
  * This query will return the repository todos/1000 sloc
  * we'll use this as the base for subsequent queries.
  */
-SELECT STD((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.sample FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample;
+SELECT SQRT(GREATEST(SUM(M.todo_density_sumsq) / SUM(M.density_commits)
+                     - POW(SUM(M.todo_density_sum) / SUM(M.density_commits), 2), 0)) as todo_lines, R.name, M.sample FROM
+        monthly_rollups M
+        INNER JOIN repos R ON R.repo_id = M.repo_id
+        GROUP BY R.name, M.sample;
 
 /* 
  * This query will prove the hypothesis which states
@@ -14,19 +21,17 @@ SELECT STD((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.s
  */ 
 SELECT sample, AVG(todo_lines)
     FROM (
-        SELECT AVG((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.sample FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample
+        SELECT SUM(M.todo_density_sum) / SUM(M.density_commits) as todo_lines, M.repo_id, M.sample FROM
+        monthly_rollups M
+        GROUP BY M.repo_id, M.sample
     ) AS T
     GROUP BY sample;
 
 SELECT sample, STD(todo_lines)
     FROM (
-        SELECT AVG((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.sample FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample
+        SELECT SUM(M.todo_density_sum) / SUM(M.density_commits) as todo_lines, M.repo_id, M.sample FROM
+        monthly_rollups M
+        GROUP BY M.repo_id, M.sample
     ) AS T
     GROUP BY sample;
 
@@ -35,48 +40,33 @@ SELECT sample, STD(todo_lines)
  * that Scientific repositories will have a higher
  * amount of TODO's per thousand **source** lines.
  */ 
-SELECT sample, name, AVG(todo_lines)
-    FROM (
-        SELECT AVG((C.regex_lines / C.source_lines) * 1000) as todo_lines, R.name, R.sample FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample
-    ) AS T
-    GROUP BY sample, name;
+SELECT M.sample, R.name, SUM(M.source_todo_density_sum) / SUM(M.source_density_commits) as todo_lines
+    FROM monthly_rollups M
+    INNER JOIN repos R ON R.repo_id = M.repo_id
+    GROUP BY M.sample, R.name;
 
 /* 
  * This query breaks it down by year.
  */ 
 SELECT T.sample, T.commit_year, AVG(todo_lines)
     FROM (
-        SELECT AVG((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.sample, YEAR(C.commit_date) as commit_year FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample, YEAR(C.commit_date)
+        SELECT SUM(M.todo_density_sum) / SUM(M.density_commits) as todo_lines, M.repo_id, M.sample, M.commit_year FROM
+        monthly_rollups M
+        GROUP BY M.repo_id, M.sample, M.commit_year
     ) AS T
     GROUP BY T.commit_year, T.sample;
 /* 
  * This query breaks it down by month and year.
  */ 
-SELECT T.commit_year, T.commit_month, T.sample, T.name, AVG(todo_lines)
-    FROM (
-        SELECT AVG((C.regex_lines / C.physical_lines) * 1000) as todo_lines, R.name, R.sample, YEAR(C.commit_date) as commit_year, MONTH(C.commit_date) as commit_month FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample, YEAR(C.commit_date), MONTH(C.commit_date)
-    ) AS T
-    GROUP BY T.commit_year, T.commit_month, T.sample, T.name
-    ORDER BY commit_year, commit_month, T.sample, T.name;
+SELECT M.commit_year, M.commit_month, M.sample, R.name, M.todo_density_sum / M.density_commits as todo_lines
+    FROM monthly_rollups M
+    INNER JOIN repos R ON R.repo_id = M.repo_id
+    ORDER BY M.commit_year, M.commit_month, M.sample, R.name;
 
 
-SELECT T.commit_year, T.commit_month, T.sample, AVG(comment_lines)
-    FROM (
-        SELECT AVG((C.comment_lines / C.physical_lines) * 1000) as comment_lines, R.name, R.sample, YEAR(C.commit_date) as commit_year, MONTH(C.commit_date) as commit_month FROM
-        repos R
-        INNER JOIN commits C ON R.repo_id = C.repo_id
-        GROUP BY R.name, R.sample, YEAR(C.commit_date), MONTH(C.commit_date)
-    ) AS T
-    GROUP BY T.commit_year, T.commit_month, T.sample
+SELECT M.commit_year, M.commit_month, M.sample, AVG(M.comment_density_sum / M.density_commits)
+    FROM monthly_rollups M
+    GROUP BY M.commit_year, M.commit_month, M.sample
     ORDER BY commit_year, commit_month, sample;
 
 /*
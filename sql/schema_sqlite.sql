@@ -0,0 +1,93 @@
+/*
+ * schema.sql for SQLite, which python/sqlload.py loads into when no MySQL server is at hand
+ */
+
+CREATE TABLE IF NOT EXISTS repos
+(
+    repo_id INTEGER PRIMARY KEY,
+    name varchar(500),
+    sample varchar(100)
+);
+
+CREATE TABLE IF NOT EXISTS commits
+(
+    commit_id INTEGER PRIMARY KEY,
+    repo_id int not null,
+    commit_hash varchar(50) not null,
+    commit_date DATETIME not null,
+    parent_commit_1 varchar(50),
+    parent_commit_2 varchar(50),
+    physical_lines int not null,
+    source_lines int not null,
+    comment_lines int not null,
+    single_line_comment int not null,
+    block_comment int not null,
+    mixed_comment int not null,
+    empty int not null,
+    todo_lines int not null,
+    regex_lines int not null,
+    author VARCHAR(50),
+    FOREIGN KEY(repo_id) REFERENCES repos(repo_id)
+);
+
+CREATE TABLE IF NOT EXISTS todos
+(
+    repo_id int not null,
+    todo_id int not null,
+    added DATETIME,
+    deleted DATETIME,
+    age double,
+    filetouches int not null,
+    author_union int not null,
+    author_intersect int not null,
+    body text,
+    contexts text,
+    filepaths text,
+    PRIMARY KEY(repo_id, todo_id),
+    FOREIGN KEY(repo_id) REFERENCES repos(repo_id)
+);
+
+CREATE TABLE IF NOT EXISTS repo_summaries
+(
+    repo_id int not null,
+    total_commits int not null,
+    earliest_commit_epoch double,
+    latest_commit_epoch double,
+    days_of_data double,
+    top_1_author_commits int not null,
+    top_25_authors_commits int not null,
+    top_50_authors_commits int not null,
+    top_75_authors_commits int not null,
+    all_authors_commits int not null,
+    author_gini double,
+    bus_factor int,
+    PRIMARY KEY(repo_id),
+    FOREIGN KEY(repo_id) REFERENCES repos(repo_id)
+);
+
+/*
+ * Per repo and month sums over commits, kept up to date by python/sqlload.py as each repo is
+ * loaded, so the interesting queries don't aggregate the whole commits table every run
+ */
+CREATE TABLE IF NOT EXISTS monthly_rollups
+(
+    repo_id int not null,
+    sample varchar(100),
+    commit_year int not null,
+    commit_month int not null,
+    commits int not null,
+    density_commits int not null,
+    todo_density_sum double not null,
+    todo_density_sumsq double not null,
+    comment_density_sum double not null,
+    source_density_commits int not null,
+    source_todo_density_sum double not null,
+    PRIMARY KEY(repo_id, commit_year, commit_month),
+    FOREIGN KEY(repo_id) REFERENCES repos(repo_id)
+);
+
+CREATE INDEX IF NOT EXISTS monthly_rollups_sample ON monthly_rollups(sample, commit_year, commit_month);
+CREATE INDEX IF NOT EXISTS repos_name ON repos(name);
+CREATE INDEX IF NOT EXISTS commits_repo_date ON commits(repo_id, commit_date);
+CREATE INDEX IF NOT EXISTS commits_hash ON commits(commit_hash);
+CREATE INDEX IF NOT EXISTS commits_parent_1 ON commits(parent_commit_1);